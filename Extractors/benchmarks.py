@@ -0,0 +1,548 @@
+"""
+Micro-benchmarks of the extraction steps.
+
+Run this file from the folder containing `areas.wotw`, the timings are printed.
+"""
+
+import contextlib
+import importlib
+import io
+import os
+import random
+import re
+import sys
+import tempfile
+import timeit
+import tracemalloc
+from types import SimpleNamespace
+from typing import Any, Callable, Iterator
+
+from extract_data import scan_areas
+from extract_rules import (
+    EmitOptions,
+    RuleEmitter,
+    RulesParser,
+    convert_diff,
+    energy_costs,
+    load_logic,
+    other_glitches,
+    parse_parallel,
+    write_files,
+)
+from reachability import ReachabilityEngine, read_item_names
+from rule_tables import write_tables
+from tokenizer import lex, read_areas, tokenize
+
+# %% Lexer
+
+# Regular expressions of the former per-line preprocessing, kept as the reference for the lexer benchmark
+r_comment = re.compile(" *#")
+r_indent = re.compile("^ *")
+r_trailing = re.compile(" *$")
+r_colon = re.compile(" .*:")
+r_separate = re.compile(" at ")
+r_type = re.compile("^[a-z]+ ")
+r_name = re.compile(" [a-zA-Z.=0-9]+:")
+r_difficulty = re.compile("^[a-z]+[,:]")
+
+
+def regex_lex(source_text: list[str]) -> int:
+    """Preprocess and classify the lines with the former regular expressions, return the number of lines."""
+    count = 0
+    for line in source_text:
+        m = r_comment.search(line)
+        if m:
+            line = line[: m.start()]
+        m = r_trailing.search(line)
+        if m:
+            line = line[: m.start()]
+        if line == "":
+            continue
+        m = r_indent.match(line)
+        indent = (m.end() + 1) // 2
+        line = line[m.end() :]
+        count += 1
+        if indent == 0:
+            if "anchor" in line:
+                r_separate.search(r_colon.search(line).group())
+            elif "region" in line:
+                r_colon.search(line)
+        elif indent == 1:
+            if r_type.search(line):
+                r_name.search(line)
+                line.find("free")
+            else:  # Region requirement, the difficulty was searched twice by `try_group` and `try_end`
+                r_difficulty.search(line)
+                r_difficulty.search(line)
+        elif indent == 2:
+            r_difficulty.search(line)
+            r_difficulty.search(line)
+    return count
+
+
+def table_lex(source_text: list[str]) -> int:
+    """Preprocess the lines with the tokenizer and classify them with the lexer, return the number of lines."""
+    count = 0
+    for _, indent, text in tokenize(source_text):
+        if indent <= 2:  # Deeper lines are always requirement lines, they are not lexed by the parser
+            lex(text)
+        count += 1
+    return count
+
+
+def bench_lexer(number: int = 10) -> None:
+    """Compare the former regular expressions with the tokenizer and lexer on `areas.wotw`."""
+    with open("./areas.wotw", "r") as file:
+        source_text = file.readlines()
+
+    assert regex_lex(source_text) == table_lex(source_text), "The two methods do not read the same lines."
+    regex_time = min(timeit.repeat(lambda: regex_lex(source_text), number=number, repeat=3)) / number
+    table_time = min(timeit.repeat(lambda: table_lex(source_text), number=number, repeat=3)) / number
+    print(f"Lexer ({len(source_text)} lines)")
+    print(f"    regular expressions: {regex_time * 1000:.2f} ms")
+    print(f"    tokenizer + lexer:   {table_time * 1000:.2f} ms ({regex_time / table_time:.2f}x)")
+
+
+# %% Parser
+
+
+def bench_parallel(workers: int = 0) -> None:
+    """Compare the serial parsing of `areas.wotw` with a process pool (by default, one worker per CPU)."""
+    lines = read_areas()
+    workers = workers or max(os.cpu_count() or 1, 2)
+    serial = RulesParser().parse(lines)
+    assert parse_parallel(lines, workers) == serial, "The parallel parsing does not give the same logic."
+    serial_time = min(timeit.repeat(lambda: RulesParser().parse(lines), number=1, repeat=3))
+    parallel_time = min(timeit.repeat(lambda: parse_parallel(lines, workers), number=1, repeat=3))
+    print(f"Parser ({len(lines)} records, {len(serial['rules'])} rules)")
+    print(f"    serial:               {serial_time * 1000:.2f} ms")
+    print(f"    parallel ({workers} workers): {parallel_time * 1000:.2f} ms ({serial_time / parallel_time:.2f}x)")
+
+
+# %% Generated rules
+
+bench_package = "wotw_bench"  # Name of the package in which the generated files are imported
+
+# Stand-ins for the helpers of the AP world, that the generated rules import
+# `has_enough_resources` pays the energy and the damage of the resources with the fragments, so that its result
+# depends on the amounts: 2 quarters of energy per energy fragment, 5 health per health fragment
+stub_functions = (
+    f"energy_costs = {energy_costs}\n\n\n"
+    "def resource_cost(resource):\n"
+    "    kind, value = resource\n"
+    "    if kind == \"energy\":\n"
+    "        return energy_costs.get(value[0], 4) * value[1], 0\n"
+    "    if kind == \"db\":\n"
+    "        return 0, value\n"
+    "    if kind == \"wall\":\n"
+    "        return 1, value[1] // 4\n"
+    "    enemy, count = value if isinstance(value, tuple) else (value, 1)\n"
+    "    return 2 * count, 5 * count\n\n\n"
+    "def has_enough_resources(and_req, or_req, ref_resource, s, p, o, moki):\n"
+    "    energy = 2 * s.count(\"Energy Fragment\", p)\n"
+    "    health = 5 * s.count(\"Health Fragment\", p)\n"
+    "    for resource in and_req:\n"
+    "        cost, damage = resource_cost(resource)\n"
+    "        energy -= cost\n"
+    "        health -= damage\n"
+    "    if not or_req:\n"
+    "        return energy >= 0 and health > 0\n"
+    "    return any(energy >= cost and health > damage for cost, damage in map(resource_cost, or_req))\n\n\n"
+    "def can_open_door(target, s, p, spawn):\n"
+    "    return s.count(\"Keystone\", p) >= 2\n\n\n"
+    "def can_buy_shop(s, p):\n"
+    "    return s.has(\"Spirit Light\", p)\n\n\n"
+    "can_buy_map = can_buy_shop\n\n\n"
+    "def has_enough_max_health(s, p, o, amount):\n"
+    "    return s.count(\"Health Fragment\", p) >= amount // 10\n"
+) + "".join(
+    f"\n\ndef {function.split('(')[0]}(s, p):\n    return s.has(\"{glitch}\", p)\n"
+    for glitch, function in other_glitches.items()
+)
+
+# Stand-in for `worlds.generic.Rules.add_rule` and `set_rule`, with the same way of combining the rules: the default
+# rule (always true) is replaced with `and`, and kept with `or`
+stub_add_rule = (
+    "def add_rule(spot, rule, combine=\"and\"):\n"
+    "    old_rule = spot.access_rule\n"
+    "    if old_rule is type(spot).access_rule:\n"
+    "        spot.access_rule = rule if combine == \"and\" else old_rule\n"
+    "    elif combine == \"and\":\n"
+    "        spot.access_rule = lambda state: rule(state) and old_rule(state)\n"
+    "    else:\n"
+    "        spot.access_rule = lambda state: rule(state) or old_rule(state)\n\n\n"
+    "def set_rule(spot, rule):\n"
+    "    spot.access_rule = rule\n"
+)
+
+
+class FakeSpot:
+    """Entrance or location of the fake world, only holds the access rule (always true by default, as in AP)."""
+
+    access_rule = staticmethod(lambda state: True)
+
+
+def no_access(state: "FakeState") -> bool:
+    """Rule of the entrances when the world creates them, before the rules are added with `or`."""
+    return False
+
+
+class FakeWorld:
+    """Minimal stand-in of the AP world, for the `set_*_rules` functions."""
+
+    def __init__(self) -> None:
+        self.player = 1
+        self.options = SimpleNamespace(spawn=SimpleNamespace(value=0))
+        self.entrances: dict[str, FakeSpot] = {}
+        self.locations: dict[str, FakeSpot] = {}
+
+    def get_entrance(self, name: str) -> FakeSpot:
+        entrance = self.entrances.get(name)
+        if entrance is None:
+            entrance = self.entrances[name] = FakeSpot()
+            entrance.access_rule = no_access
+        return entrance
+
+    def get_location(self, name: str) -> FakeSpot:
+        location = self.locations.get(name)
+        if location is None:
+            location = self.locations[name] = FakeSpot()
+        return location
+
+
+class FakeState:
+    """Minimal stand-in of the AP collection state, with a fixed item count."""
+
+    def __init__(self, items: dict[str, int]) -> None:
+        self.items = items
+
+    def has(self, item: str, player: int) -> bool:
+        return self.items.get(item, 0) > 0
+
+    def has_all(self, items: tuple[str, ...], player: int) -> bool:
+        return all(self.items.get(item, 0) > 0 for item in items)
+
+    def has_any(self, items: tuple[str, ...], player: int) -> bool:
+        return any(self.items.get(item, 0) > 0 for item in items)
+
+    def count(self, item: str, player: int) -> int:
+        return self.items.get(item, 0)
+
+
+def make_package(root: str) -> str:
+    """Create the stub package (and the stub `worlds.generic.Rules` module) in `root`, return the package folder."""
+    package_dir = os.path.join(root, bench_package)
+    for folder in (package_dir, os.path.join(root, "worlds"), os.path.join(root, "worlds", "generic")):
+        os.makedirs(folder, exist_ok=True)
+        open(os.path.join(folder, "__init__.py"), "w").close()
+    with open(os.path.join(root, "worlds", "generic", "Rules.py"), "w") as file:
+        file.write(stub_add_rule)
+    with open(os.path.join(package_dir, "RulesFunctions.py"), "w") as file:
+        file.write(stub_functions)
+    return package_dir
+
+
+def count_code_objects(code: Any) -> int:
+    """Return the number of code objects in the compiled module (i.e. the module, the functions and the lambdas)."""
+    return 1 + sum(count_code_objects(const) for const in code.co_consts if hasattr(const, "co_consts"))
+
+
+def set_all_rules(module: Any, world: FakeWorld) -> None:
+    """Call all the `set_*_rules` functions of the generated module on the world."""
+    for name in ("moki", "gorlek", "gorlek_glitched", "kii", "kii_glitched", "unsafe", "unsafe_glitched"):
+        getattr(module, f"set_{name}_rules")(world)
+
+
+def evaluate_all(world: FakeWorld, states: list[FakeState]) -> int:
+    """
+    Evaluate the access rule of every entrance and location for each state, return the number of accessible
+    entrances and locations.
+    """
+    rules = [spot.access_rule for spots in (world.entrances, world.locations) for spot in spots.values()]
+    return sum(rule(state) for state in states for rule in rules)
+
+
+def accessible_spots(world: FakeWorld, states: list[FakeState]) -> set[tuple[int, str]]:
+    """Return the accessible entrances and locations for each state, as (index of the state, name)."""
+    spots = {**world.entrances, **world.locations}
+    return {
+        (index, name) for index, state in enumerate(states) for name, spot in spots.items() if spot.access_rule(state)
+    }
+
+
+def measure_rules(package_dir: str, name: str, states: list[FakeState], number: int = 5) -> dict[str, Any]:
+    """Return the timings and memory use of the generated module `name` of the stub package."""
+    with open(os.path.join(package_dir, f"{name}.py"), "r") as file:
+        source = file.read()
+    module_name = f"{bench_package}.{name}"
+
+    compile_time = min(timeit.repeat(lambda: compile(source, name, "exec"), number=1, repeat=3))
+    code = compile(source, name, "exec")
+
+    def load() -> Any:
+        sys.modules.pop(module_name, None)
+        return importlib.import_module(module_name)
+
+    import_time = min(timeit.repeat(load, number=1, repeat=3))
+
+    tracemalloc.start()
+    module = load()
+    module_memory = tracemalloc.get_traced_memory()[0]
+    world = FakeWorld()
+    set_all_rules(module, world)
+    world_memory = tracemalloc.get_traced_memory()[0] - module_memory
+    tracemalloc.stop()
+
+    set_time = min(timeit.repeat(lambda: set_all_rules(module, FakeWorld()), number=1, repeat=3))
+    eval_time = min(timeit.repeat(lambda: evaluate_all(world, states), number=number, repeat=3)) / number
+    return {
+        "code objects": count_code_objects(code),
+        "compile (ms)": compile_time * 1000,
+        "import (ms)": import_time * 1000,
+        "module memory (kB)": module_memory / 1024,
+        "set rules (ms)": set_time * 1000,
+        "world memory (kB)": world_memory / 1024,
+        "evaluation (ms)": eval_time * 1000,
+        "accessible": accessible_spots(world, states),
+    }
+
+
+def bench_states(logic: dict[str, Any], count: int = 50, seed: int = 0) -> list[FakeState]:
+    """
+    Return the states used for the evaluation: no items, every other item, all the items, and `count` random states
+    (each item owned with a probability of one half, with a random amount).
+    """
+    items: set[str] = {"Keystone", "Spirit Light", "Health Fragment", "Energy Fragment", "Gorlek Ore"}
+    items.update(other_glitches)
+    for rule in logic["rules"]:
+        items.update(rule.skills, rule.any_skills)
+        if rule.danger:
+            items.add(f"danger_{rule.danger}")
+    ordered = sorted(items)
+    states = [FakeState({}), FakeState({item: 99 for item in ordered[::2]}), FakeState({item: 99 for item in ordered})]
+    rng = random.Random(seed)
+    for _ in range(count):
+        states.append(FakeState({item: rng.randint(1, 40) for item in ordered if rng.random() < 0.5}))
+    return states
+
+
+@contextlib.contextmanager
+def stub_package() -> Iterator[str]:
+    """Create the stub package in a temporary folder that can be imported from, and yield the package folder."""
+    with tempfile.TemporaryDirectory() as root:
+        package_dir = make_package(root)
+        sys.path.insert(0, root)
+        sys.dont_write_bytecode = True  # Always compile, as on the first import
+        try:
+            yield package_dir
+        finally:
+            sys.dont_write_bytecode = False
+            sys.path.remove(root)
+            for module_name in list(sys.modules):
+                if module_name.split(".")[0] in (bench_package, "worlds"):
+                    del sys.modules[module_name]
+
+
+def compare_rules(writers: dict[str, tuple[str, Callable[[dict[str, Any], str], None]]], same: bool = True) -> None:
+    """
+    Write and import each generated module in a stub package, and print a comparison of their costs.
+
+    `writers` maps each label to the name of the generated module and the function that writes it from the logic.
+    With `same`, check that the modules give the same accessible entrances.
+    """
+    logic = load_logic()
+    states = bench_states(logic)
+    results: dict[str, dict[str, Any]] = {}
+    with stub_package() as package_dir:
+        for label, (name, writer) in writers.items():
+            with contextlib.redirect_stdout(io.StringIO()):
+                writer(logic, package_dir)
+            importlib.invalidate_caches()
+            results[label] = measure_rules(package_dir, name, states)
+
+    accessible = [result["accessible"] for result in results.values()]
+    assert not same or all(spots == accessible[0] for spots in accessible), (
+        "The generated modules do not give the same accessible entrances."
+    )
+    labels = list(results)
+    print(f"Generated rules ({len(logic['rules'])} rules, {len(states)} states evaluated)")
+    print(f"    {'':<20}" + "".join(f"{label:>16}" for label in labels))
+    for key in results[labels[0]]:
+        if key != "accessible":
+            spec = ">16.1f" if "(" in key else ">16d"  # Measures with a unit are floats
+            print(f"    {key:<20}" + "".join(format(results[label][key], spec) for label in labels))
+
+
+def write_clauses(logic: dict[str, Any], out_dir: str) -> None:
+    """Write `Rules.py` with one `add_rule` call per clause, instead of one per entrance."""
+    emitter = RuleEmitter(EmitOptions(coalesce=False))
+    for rule in logic["rules"]:
+        emitter.add(rule)
+    write_files(logic, out_dir, emitter)
+
+
+def bench_coalesce() -> None:
+    """Compare one `add_rule` call per clause with one `add_rule` call per entrance and difficulty."""
+    compare_rules({"per clause": ("Rules", write_clauses), "per entrance": ("Rules", write_files)})
+
+
+def bench_tables() -> None:
+    """Compare the lambdas of `Rules.py` with the requirement tables of `RulesTables.py`."""
+    compare_rules({"lambdas": ("Rules", write_files), "tables": ("RulesTables", write_tables)})
+
+
+def bench_refills() -> None:
+    """Compare the refills written as events (with their regions and entrances) with the refills written as data."""
+    logic = load_logic()
+    events, _, regions = scan_areas(read_areas())
+    refill_count = len(logic["refill_events"])
+    print(f"Refills ({len(logic['refills'])} regions with refills)")
+    print(f"    {'':<20}{'events':>16}{'data':>16}")
+    print(f"    {'regions':<20}{len(regions) + refill_count:>16d}{len(regions):>16d}")
+    print(f"    {'entrances':<20}{len(logic['entrances']):>16d}{len(logic['entrances']) - refill_count:>16d}")
+    print(f"    {'events':<20}{len(events) + refill_count:>16d}{len(events):>16d}")
+    data = EmitOptions(refill_events=False)
+    with tempfile.TemporaryDirectory() as out_dir, contextlib.redirect_stdout(io.StringIO()):
+        event_time = min(timeit.repeat(lambda: write_files(logic, out_dir), number=1, repeat=3))
+        data_time = min(timeit.repeat(lambda: write_files(logic, out_dir, options=data), number=1, repeat=3))
+    print(f"    {'generation (ms)':<20}{event_time * 1000:>16.1f}{data_time * 1000:>16.1f}")
+    compare_rules(
+        {
+            "events": ("Rules", write_files),
+            "data": ("Rules", lambda logic, out_dir: write_files(logic, out_dir, options=data)),
+        },
+        same=False,
+    )
+
+
+def set_moki_world() -> FakeWorld:
+    """Import the generated rules as on the first import, and add the moki rules to a new world."""
+    for module_name in list(sys.modules):
+        if module_name.startswith(f"{bench_package}.Rules"):
+            del sys.modules[module_name]
+    world = FakeWorld()
+    importlib.import_module(f"{bench_package}.Rules").set_moki_rules(world)
+    return world
+
+
+def bench_split() -> None:
+    """Compare the setup of a moki world with all the difficulties in `Rules.py`, and with one module per difficulty."""
+    logic = load_logic()
+    states = bench_states(logic)
+    results: dict[str, dict[str, Any]] = {}
+    with stub_package() as package_dir:
+        for label, split in (("one module", False), ("split", True)):
+            with contextlib.redirect_stdout(io.StringIO()):
+                write_files(logic, package_dir, options=EmitOptions(split=split))
+            importlib.invalidate_caches()
+            setup_time = min(timeit.repeat(set_moki_world, number=1, repeat=3))
+            tracemalloc.start()
+            world = set_moki_world()
+            memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            modules = [name for name in sys.modules if name.startswith(f"{bench_package}.Rules")]
+            results[label] = {
+                "modules imported": len(modules) - 1,  # Without `RulesFunctions`
+                "import + set (ms)": setup_time * 1000,
+                "memory (kB)": memory / 1024,
+                "accessible": accessible_spots(world, states),
+            }
+            for name in os.listdir(package_dir):
+                if name.startswith("Rules") and name != "RulesFunctions.py":
+                    os.remove(os.path.join(package_dir, name))
+
+    assert results["one module"]["accessible"] == results["split"]["accessible"], "The moki rules are not the same."
+    print(f"Moki world ({len(states)} states evaluated)")
+    print(f"    {'':<20}" + "".join(f"{label:>16}" for label in results))
+    for key in results["split"]:
+        if key != "accessible":
+            spec = ">16.1f" if "(" in key else ">16d"
+            print(f"    {key:<20}" + "".join(format(result[key], spec) for result in results.values()))
+
+
+def set_worlds(module: Any, players: int, factories: bool) -> list[FakeWorld]:
+    """Return the worlds of the players, with all the rules (unsafe with glitches) of the generated module."""
+    worlds = [FakeWorld() for _ in range(players)]
+    for world in worlds:
+        if factories:
+            module.set_difficulty_rules(world, 3, True)
+        else:
+            set_all_rules(module, world)
+    return worlds
+
+
+def bench_factories(players: int = 10) -> None:
+    """Compare the lambdas of `Rules.py` with the rule factories shared by the worlds, for several players."""
+    logic = load_logic()
+    states = bench_states(logic)
+    results: dict[str, dict[str, Any]] = {}
+    with stub_package() as package_dir:
+        for label, factories in (("lambdas", False), ("factories", True)):
+            with contextlib.redirect_stdout(io.StringIO()):
+                write_files(logic, package_dir, options=EmitOptions(factories=factories))
+            importlib.invalidate_caches()
+            sys.modules.pop(f"{bench_package}.Rules", None)
+            module = importlib.import_module(f"{bench_package}.Rules")
+            first_time = min(timeit.repeat(lambda: set_worlds(module, 1, factories), number=1, repeat=3))
+            set_time = min(timeit.repeat(lambda: set_worlds(module, players, factories), number=1, repeat=3))
+            tracemalloc.start()
+            worlds = set_worlds(module, players, factories)
+            memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            eval_time = min(timeit.repeat(lambda: evaluate_all(worlds[0], states), number=5, repeat=3)) / 5
+            results[label] = {
+                "set 1 world (ms)": first_time * 1000,
+                f"set {players} worlds (ms)": set_time * 1000,
+                "worlds memory (kB)": memory / 1024,
+                "evaluation (ms)": eval_time * 1000,
+                "accessible": accessible_spots(worlds[0], states),
+            }
+
+    assert results["lambdas"]["accessible"] == results["factories"]["accessible"], "The rules are not the same."
+    print(f"Worlds ({players} players, unsafe with glitches)")
+    print(f"    {'':<20}" + "".join(f"{label:>16}" for label in results))
+    for key in results["lambdas"]:
+        if key != "accessible":
+            print(f"    {key:<20}" + "".join(format(result[key], ">16.1f") for result in results.values()))
+
+
+def bench_shared() -> None:
+    """Compare the clauses written inline in each rule with the clauses used by several rules written once."""
+    compare_rules(
+        {
+            "inline": ("Rules", write_files),
+            "shared": (
+                "Rules",
+                lambda logic, out_dir: write_files(logic, out_dir, options=EmitOptions(shared_clauses=True)),
+            ),
+        }
+    )
+
+
+def bench_reachability(spawn: str = "MarshSpawn.Main", number: int = 100) -> None:
+    """Time the compilation of the logic and the queries of the reachability engine, for each difficulty."""
+    logic = load_logic(inline_macros=True)
+    items = read_item_names()
+    counts = {"Keystone": 40, "Spirit Light": 20000, "Gorlek Ore": 40}
+    print(f"Reachability engine (from {spawn})")
+    print(f"    {'':<20}{'build (ms)':>16}{'no items (us)':>16}{'all items (us)':>16}")
+    for difficulty, name in enumerate(convert_diff):
+        build_time = min(timeit.repeat(lambda: ReachabilityEngine(logic, difficulty), number=1, repeat=3))
+        engine = ReachabilityEngine(logic, difficulty)
+        empty_time = min(timeit.repeat(lambda: engine.reach(spawn), number=number, repeat=3)) / number
+        full_time = min(
+            timeit.repeat(lambda: engine.reach(spawn, items, counts, 200, 20), number=number, repeat=3)
+        ) / number
+        print(f"    {name:<20}{build_time * 1e3:>16.1f}{empty_time * 1e6:>16.1f}{full_time * 1e6:>16.1f}")
+
+
+if __name__ == "__main__":
+    bench_lexer()
+    bench_parallel()
+    bench_coalesce()
+    bench_tables()
+    bench_refills()
+    bench_split()
+    bench_factories()
+    bench_shared()
+    bench_reachability()
@@ -0,0 +1,47 @@
+"""
+Persistent cache of the data parsed from the `areas.wotw` file.
+
+The entries are keyed by a hash of the source files and of the extractor version, so that the parsing can be skipped
+when nothing changed since the last run. Delete the `.wotw_cache` folder to clear the cache.
+"""
+
+import hashlib
+import os
+import pickle
+from typing import Any, Optional
+
+cache_dir = "./.wotw_cache"
+
+
+def cache_key(paths: tuple[str, ...], version: int) -> str:
+    """Return the hash of the content of the given files and of the extractor version."""
+    digest = hashlib.sha256(f"version={version}\n".encode())
+    for path in paths:
+        with open(path, "rb") as file:
+            digest.update(hashlib.sha256(file.read()).digest())
+    return digest.hexdigest()
+
+
+def load(name: str, key: str) -> Optional[Any]:
+    """Return the cached data for this name if it was stored with the same key, None otherwise."""
+    path = os.path.join(cache_dir, f"{name}.pickle")
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as file:
+            stored_key, data = pickle.load(file)
+    except (OSError, pickle.UnpicklingError, EOFError, ValueError, AttributeError, ImportError):
+        return None  # Unreadable or outdated entry, it gets replaced on the next store
+    if stored_key != key:
+        return None
+    return data
+
+
+def store(name: str, key: str, data: Any) -> None:
+    """Store the data in the cache under this name."""
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f"{name}.pickle")
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as file:
+        pickle.dump((key, data), file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, path)  # Atomic, so an interrupted run cannot leave a broken entry
@@ -5,25 +5,86 @@ The data is extracted from the `areas.wotw` and `loc_data.csv` files.
 See https://github.com/ori-community/wotw-seedgen/tree/main/wotw_seedgen to get these files.
 """
 
-import re
 import os
 
-com = re.compile(" *#")  # Detects comments
-sp = re.compile("^ *")  # Used for indents
-col = re.compile(" .*:")  # name between space and colon
-tra = re.compile(" *$")  # Trailing space
-sep = re.compile(" at ")
-
-
-def extract_all(override=False):
-    """Extract the data on events, regions and locations."""
-    extract_events(override)
-    extract_quests(override)
-    extract_regions(override)
-
+import cache
+from tokenizer import Line, lex, read_areas
+
+scan_version = 2  # Increase it when `scan_areas` changes, to invalidate the cached data
+
+combat_events = [
+    "Combat.Ranged",
+    "Combat.Aerial",
+    "Combat.Dangerous",
+    "Combat.Shielded",
+    "Combat.Bat",
+    "Combat.Sand",
+]
+
+other_events = [
+    "BreakCrystal",
+]
+
+
+def extract_all(override=False, inline_macros=False):
+    """
+    Extract the data on events, regions and locations, with a single pass on `areas.wotw`.
+
+    The scanned data is cached, so `areas.wotw` is not read again if it did not change since the last run.
+    With `inline_macros`, the macros are not events (use the same value as for `extract_rules.parse_rules`).
+    """
+    key = cache.cache_key(("./areas.wotw", "./loc_data.csv"), scan_version)
+    cache_name = "data_macros" if inline_macros else "data"
+    scanned = cache.load(cache_name, key)
+    if scanned is None:
+        scanned = scan_areas(read_areas(), inline_macros)
+        cache.store(cache_name, key, scanned)
+    events, quests, regions = scanned
+    extract_events(override, events)
+    extract_quests(override, quests)
+    extract_regions(override, regions)
+
+
+def scan_areas(records: tuple[Line, ...], inline_macros=False) -> tuple[list[str], list[str], list[str]]:
+    """
+    Return the events, the quests and the regions from the tokenized `areas.wotw` file, in one pass.
+
+    With `inline_macros`, the macros (`requirement` blocks) are not added to the events.
+    """
+    events = combat_events + other_events
+    quests = []
+    regions = []
 
-def extract_quests(override=False):
-    """Extract the data from `areas.wotw` and write a file with the quest table."""
+    for _, ind, text in records:
+        if ind > 1:
+            continue
+        token = lex(text)
+        if ind == 0:
+            if token.kind == "requirement":
+                if token.name not in events and not inline_macros:
+                    events.append(token.name)
+            elif token.kind == "region":
+                if token.name not in events:
+                    events.append(f"danger_{token.name}")
+            elif token.kind == "anchor":
+                if token.name not in regions:
+                    regions.append(token.name)
+        elif token.kind == "state":
+            if token.name not in events:
+                events.append(token.name)
+        elif token.kind == "quest":
+            if token.name not in quests:
+                quests.append(token.name)
+
+    return events, quests, regions
+
+
+def extract_quests(override=False, quests=None):
+    """
+    Extract the data from `areas.wotw` and write a file with the quest table.
+
+    The quests can be given (as returned by `scan_areas`) to avoid reading `areas.wotw` again.
+    """
     if os.path.exists("./Quests.py"):
         if override:
             print("Warning: File replaced")
@@ -38,35 +99,11 @@ def extract_quests(override=False):
         '"""\n\n\n'
     )
 
-    quests = []
+    if quests is None:
+        quests = scan_areas(read_areas())[1]
 
     quest_txt = header + "quest_table = [\n"
 
-    with open("./areas.wotw", "r") as file:
-        temp = file.readlines()
-
-    for p in temp:
-        m = com.search(p)  # Removes the comments
-        if m:
-            p = p[: m.start()]
-        m = tra.search(p)  # Removes the trailing spaces
-        if m:
-            p = p[: m.start()]
-        if p == "":
-            continue
-
-        m = sp.match(p)  # Counts the indents
-        if m is None:
-            ind = 0
-        else:
-            ind = (m.end() + 1) // 2
-
-        if ind == 1:
-            if "pickup" in p or "quest" in p:
-                name = col.search(p[2:]).group()[1:-1]
-                if "quest" in p and name not in quests:
-                    quests.append(name)
-
     for quest in quests:
         quest_txt += f'    "{quest}",\n'
     quest_txt = quest_txt[:-2]
@@ -77,8 +114,12 @@ def extract_quests(override=False):
         print("The file Quests.py has been successfully created.")
 
 
-def extract_events(override=False):
-    """Extract the data and write them as a table with the events."""
+def extract_events(override=False, events=None):
+    """
+    Extract the data and write them as a table with the events.
+
+    The events can be given (as returned by `scan_areas`) to avoid reading `areas.wotw` again.
+    """
     if os.path.exists("./Events.py"):
         if override:
             print("Warning: File replaced")
@@ -93,57 +134,11 @@ def extract_events(override=False):
         '"""\n\n\n'
     )
 
-    combat_events = [
-        "Combat.Ranged",
-        "Combat.Aerial",
-        "Combat.Dangerous",
-        "Combat.Shielded",
-        "Combat.Bat",
-        "Combat.Sand",
-    ]
-
-    other_events = [
-        "BreakCrystal",
-    ]
-
-    events = combat_events + other_events
+    if events is None:
+        events = scan_areas(read_areas())[0]
 
     event_txt = "event_table = [\n"
 
-    with open("./areas.wotw", "r") as file:
-        temp = file.readlines()
-
-    for p in temp:
-        m = com.search(p)  # Removes the comments
-        if m:
-            p = p[: m.start()]
-        m = tra.search(p)  # Removes the trailing spaces
-        if m:
-            p = p[: m.start()]
-        if p == "":
-            continue
-
-        m = sp.match(p)  # Counts the indents
-        if m is None:
-            ind = 0
-        else:
-            ind = (m.end() + 1) // 2
-
-        if ind == 0:
-            if "requirement" in p:
-                name = col.search(p).group()[1:-1]
-                if name not in events:
-                    events.append(name)
-            elif "region" in p:
-                name = col.search(p).group()[1:-1]
-                if name not in events:
-                    events.append(f"danger_{name}")
-        elif ind == 1:
-            if "state" in p:
-                name = col.search(p[2:]).group()[1:-1]
-                if name not in events:
-                    events.append(name)
-
     for event in events:
         event_txt += f'    "{event}",\n'
 
@@ -155,8 +150,12 @@ def extract_events(override=False):
         print("The file Events.py has been successfully created.")
 
 
-def extract_regions(override=False):
-    """Extract the data and write a file with the regions."""
+def extract_regions(override=False, regions=None):
+    """
+    Extract the data and write a file with the regions.
+
+    The regions can be given (as returned by `scan_areas`) to avoid reading `areas.wotw` again.
+    """
     if os.path.exists("./Regions.py"):
         if override:
             print("Warning: File replaced")
@@ -171,37 +170,8 @@ def extract_regions(override=False):
         '"""\n\n\n'
     )
 
-    regions = []
-
-    with open("./areas.wotw", "r") as file:
-        temp = file.readlines()
-
-    for p in temp:
-        m = com.search(p)  # Removes the comments
-        if m:
-            p = p[: m.start()]
-        m = tra.search(p)  # Removes the trailing spaces
-        if m:
-            p = p[: m.start()]
-        if p == "":
-            continue
-
-        m = sp.match(p)  # Counts the indents
-        if m is None:
-            ind = 0
-        else:
-            ind = (m.end() + 1) // 2
-
-        if ind == 0:
-            if "anchor" in p:
-                name = col.search(p).group()[1:-1]
-                s = sep.search(name)
-                if s:
-                    anc = name[: s.start()]
-                else:
-                    anc = name
-                if anc not in regions:
-                    regions.append(anc)
+    if regions is None:
+        regions = scan_areas(read_areas())[2]
 
     region_txt = header + "region_table = [\n"
 
@@ -1,15 +1,29 @@
 """
 Converts an areas.wotw file into a set_rules function.
 
-Run `parse_rules()` to extract the rules from the `areas.wotw` file.
+Run `parse_rules()` to extract the rules from the `areas.wotw` file and write the generated files.
+The parsing itself is done by `RulesParser`, which holds its own state: importing this module does not parse anything.
 See https://github.com/ori-community/wotw-seedgen/tree/main/wotw_seedgen to get this file.
 """
 
+import io
+import itertools
+import os
 import re
-from typing import Pattern
+import shutil
+import tempfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Iterable, NamedTuple, Optional, TextIO
 
-# %% Data and global variables
+import cache
+from logic import Rule, new_logic
+from simplify import glitched_tiers, prune_tiers, simplify_rules
+from tokenizer import Line, lex, read_areas
 
+# %% Data
+
+parser_version = 7  # Increase it when the parsing changes, to invalidate the cached logic
 
 name_convert: dict[str, str] = {  # Translation of the item names
     "DoubleJump": "Double Jump",
@@ -39,17 +53,6 @@ name_convert: dict[str, str] = {  # Translation of the item names
 }
 
 
-# Regular expressions used for parsing
-r_comment = re.compile(" *#")  # Detects comments
-r_indent = re.compile("^ *")  # Used for indents
-r_colon = re.compile(" .*:")  # name between space and colon
-r_trailing = re.compile(" *$")  # Trailing space
-r_separate = re.compile(" at ")
-r_type = re.compile("^[a-z]+ ")  # Detects the type of the path
-r_name = re.compile(" [a-zA-Z.=0-9]+:")  # Name of the object
-r_difficulty = re.compile("^[a-z]+[,:]")  # extracts the difficulty of the path
-r_refill = re.compile(" [a-zA-Z=0-9]+$")  # Extracts the refill type if it has no colon
-
 en_skills = ["Bow", "Grenade", "Flash", "Sentry", "Shuriken", "Spear", "Blaze"]  # Skills that require energy
 
 # Things that require a specific treatment
@@ -128,6 +131,24 @@ other_glitches = {
     "PauseFloat": "can_pausefloat(s, p)",
 }
 
+# Items needed by the glitches that the rules use as requirements, as alternatives (see the header of `areas.wotw`)
+glitch_items: dict[str, list[tuple[str, ...]]] = {
+    "WaveDash": [("Dash", "Regenerate")],
+    "AerialHammerJump": [("Hammer", "Double Jump")],
+    "SwordJump": [("Sword", "Double Jump")],
+    "GlideHammerJump": [("Glide", "Hammer")],
+    "GlideBashChain": [("Bash", "Glide")],
+    "DoubleJumpBashChain": [("Bash", "Double Jump")],
+    "DashBashChain": [("Bash", "Dash")],
+    "LaunchBashChain": [("Bash", "Launch")],
+    "AbilitySwap": [("Blaze",), ("Flash",), ("Sentry",)],
+    "PauseFloat": [()],
+    "Unpopular": [()],  # The tricks are all allowed in the glitched rule sets
+}
+
+# Weapons that can break the walls and fight the enemies (the walls of `wall_glitches` only use their own skill)
+weapons = ("Sword", "Hammer", "Bow", "Spear", "Grenade", "Shuriken", "Blaze", "Sentry", "Flash")
+
 regions_free = {
     "MarshSpawn",
     "MarshPastOpher",
@@ -136,6 +157,29 @@ regions_free = {
     "WindtornRuins",
 }  # Regions without requirements on Regenerate/max health
 
+# Bit of each glitch in the trick masks of the glitched rules (see `trick_mask`), `Unpopular` being a trick of its own
+trick_bits = {
+    name: 1 << bit for bit, name in enumerate([*energy_glitches, *wall_glitches, *inf_glitches, *other_glitches])
+}
+
+convert_diff = {"moki": 0, "gorlek": 1, "kii": 3, "unsafe": 5}  # Difficulty of the paths
+
+max_or_clauses = 64  # Maximum number of clauses made from a requirement with several `or` chains
+
+refill_prefixes = ("H.", "E.", "C.", "F.")  # Refill events: health, energy, checkpoint and full refill
+
+# Codes of the checks that have their own function, in the requirement rows (see `requirement_row`)
+DOOR, SHOP, MAP, ORE, DANGER, GLITCH = range(6)
+
+# Energy used by each skill, in quarters of energy so that the precomputed costs are integers (see `clause_costs`)
+energy_costs = {"Bow": 1, "Shuriken": 2, "Grenade": 4, "Flash": 4, "Sentry": 4, "Blaze": 4, "Spear": 8}
+
+# Sentry jumps: they use Sentry and one of these skills
+sentry_jumps = {"SentryJump": ("Sword", "Hammer"), "SwordSJump": ("Sword",), "HammerSJump": ("Hammer",)}
+
+# Item counted by the checks of `other` that have an amount, for the item index (see `referenced_names`)
+other_items = {"Keystone": "Keystone", "SpiritLight": "Spirit Light", "Ore": "Gorlek Ore", "Danger": "Health Fragment"}
+
 
 # %% Text initialisations
 
@@ -155,417 +199,386 @@ imports = (
     "    from . import WotWWorld\n\n\n"
 )
 
-# %% Helpers
+# Moki, Gorlek, Kii and Unsafe rules respectively
+moki = (
+    'def set_moki_rules(w: "WotWWorld"):\n'
+    '    """Moki (or easy, default) rules."""\n'
+    "    p = w.player\n"
+    "    o = w.options\n"
+)
+gorlek = (
+    '\n\ndef set_gorlek_rules(w: "WotWWorld"):\n'
+    '    """Gorlek (or medium) rules."""\n'
+    "    p = w.player\n"
+    "    o = w.options\n"
+)
+gorlek_glitch = (
+    '\n\ndef set_gorlek_glitched_rules(w: "WotWWorld"):\n'
+    '    """Gorlek (or medium) rules with glitches"""\n'
+    "    p = w.player\n"
+    "    o = w.options\n"
+)
+kii = (
+    '\n\ndef set_kii_rules(w: "WotWWorld"):\n'
+    '    """Kii (or hard) rules"""\n'
+    "    p = w.player\n"
+    "    o = w.options\n"
+)
+kii_glitch = (
+    '\n\ndef set_kii_glitched_rules(w: "WotWWorld"):\n'
+    '    """Kii (or hard) rules with glitches."""\n'
+    "    p = w.player\n"
+    "    o = w.options\n"
+)
+unsafe = (
+    '\n\ndef set_unsafe_rules(w: "WotWWorld"):\n' '    """Unsafe rules."""\n' "    p = w.player\n" "    o = w.options\n"
+)
+unsafe_glitch = (
+    '\n\ndef set_unsafe_glitched_rules(w: "WotWWorld"):\n'
+    '    """Unsafe rules with glitches."""\n'
+    "    p = w.player\n"
+    "    o = w.options\n"
+)
 
+# Headers of the rule functions for each difficulty
+rule_headers: list[str] = [moki, gorlek, gorlek_glitch, kii, kii_glitch, unsafe, unsafe_glitch]
+tier_names = ["moki", "gorlek", "gorlek_glitched", "kii", "kii_glitched", "unsafe", "unsafe_glitched"]
+tier_levels = (0, 1, 1, 2, 2, 3, 3)  # Difficulty of each rule set (0: moki, 1: gorlek, 2: kii, 3: unsafe)
 
-def try_group(regex: Pattern[str], text: str, begin=0, end=0) -> str:
-    """Return the result for search, sliced between begin and end. Raise an error if no match is found."""
-    match = regex.search(text)
-    if match is None:
-        raise RuntimeError(f"Could not find a match for {text} with {regex.pattern}.")
-    if begin is None:
-        begin = 0
-    if end == 0:
-        end = len(match.group()) + 1
-    return match.group()[begin:end]
-
-
-def try_end(regex: Pattern[str], text: str) -> int:
-    """Return the end position of the match. Raise an error if nomatch is found."""
-    match = regex.search(text)
-    if match is None:
-        raise RuntimeError(f"Could not find a match for {text} with {regex.pattern}.")
-    return match.end()
-
-
-def conv_refill() -> None:
-    """Get the refill type (to add before the region name) and update the data tables."""
-    global refill_type
-    current = refills[anchor]
-    if "=" in path_name:
-        value = int(path_name[-1])
-        if path_name[:-2] == "Health":
-            if current[0] == 0:
-                refills.update({anchor: (value, current[1], current[2])})
-                refill_events.append(f"H.{anchor}")
-            refill_type = "H."
-        if path_name[:-2] == "Energy":
-            if current[1] == 0:
-                refills.update({anchor: (current[0], value, current[2])})
-                refill_events.append(f"E.{anchor}")
-            refill_type = "E."
-    elif path_name == "Checkpoint":
-        refills.update({anchor: (current[0], current[1], 1)})
-        refill_events.append(f"C.{anchor}")
-        refill_type = "C."
-    elif path_name == "Full":
-        refills.update({anchor: (current[0], current[1], 2)})
-        refill_events.append(f"F.{anchor}")
-        refill_type = "F."
-    else:
-        raise ValueError(f"{path_name} is not a valid refill type (at anchor {anchor}).")
-
-
-def convert() -> None:
-    """Convert the data from req into lists, and make the calls to append_rules according to the lists' content."""
-    global path_name, health_req
-    global and_req, or_req
-    global target_area
-    global or_skills, or_resource, or_glitch
-    global and_resource, and_skills, and_other
-
-    # Reset the global values
-    health_req = 0
-    and_req = []
-    or_req = []
-    or_skills = []
-    or_resource = []
-    or_glitch = []
-    and_resource = []
-    and_skills = []
-    and_other = []
-    target_area = ""
-
-    # Get the requirements when entering a new area.
-    if path_type == "conn" and "." in path_name:
-        dot_position = path_name.find(".")
-        f_area = path_name[:dot_position]  # Extract the name of the target area
-        if "." in anchor:
-            dot_position = anchor.find(".")
-            i_area = anchor[:dot_position]  # Extract the name of the starting area
-        else:
-            i_area = ""
+# Modules of the rule functions when they are written separately (see `RuleEmitter`): RulesMoki, RulesGorlek...
+tier_modules = ["Rules" + name.title().replace("_", "") for name in tier_names]
 
-        # Apply the region requirements if the regions differ, or if exiting a door (in case door rando is used).
-        # Skip it for some regions as they don't have any danger requirement.
-        if i_area != f_area and f_area not in regions_free:
-            target_area = f_area
+dispatcher_imports = (
+    "from importlib import import_module\n\n"
+    "from typing import TYPE_CHECKING\n"
+    "if TYPE_CHECKING:\n"
+    "    from . import WotWWorld\n\n\n"
+)
 
-    if path_type == "refill":
-        path_name = refill_type + anchor
+# Function making the locations with a rule unreachable (see `RuleEmitter.located`), before their rules are added
+reset_locations = (
+    'def reset_locations(w: "WotWWorld"):\n'
+    '    """Set the rule of the locations of `rule_locations` to False, their rules are then added with `or`."""\n'
+    "    for name in rule_locations:\n"
+    "        set_rule(w.get_location(name), lambda s: False)\n\n\n"
+)
 
-    conn_name = f"{anchor} -> {path_name}"
-    if conn_name not in entrances:
-        entrances.append(conn_name)
 
-    s_req = req.split(", ")
-    for elem in s_req:
-        if " OR " in elem:
-            or_req.append(elem.split(" OR "))
-        else:
-            and_req.append(elem)
-
-    if len(or_req) == 0:
-        parse_and()
-        append_rule()
-
-    elif len(or_req) == 1:  # One `or` chain in the requirements
-        order_or(or_req[0])
-        handle_or_chain()
-
-    elif len(or_req) == 2:  # Two chains of or
-        # Swaps the two chains if it is more efficient to split the second chain
-        if len(or_req[0]) > len(or_req[1]):
-            or_req[0], or_req[1] = (or_req[1], or_req[0])
-        order_or(or_req[1])
-
-        while or_req[0]:  # Split the first or chain into the and chain
-            and_req.append(or_req[0][-1])
-            or_req[0].pop()
-            handle_or_chain()
-            and_req.pop()  # Remove the added requirement from the and chain
-
-
-def handle_or_chain() -> None:
-    """Split the requirements from the or_chain and make the calls to append_rule."""
-    global and_req
-    temp_glitch = or_glitch.copy()  # Make a copy, so it is safe to empty the list in this scope
-    while temp_glitch:  # If glitches are present, add them one at a time to the and chain
-        and_req.append(temp_glitch[-1])
-        temp_glitch.pop()
-        parse_and()
-        append_rule(use_or_resource=False)
-        and_req.pop()  # Remove the requirement added above
-    if or_skills:
-        parse_and()
-        append_rule(use_or_resource=False)
-    if or_resource:
-        parse_and()
-        append_rule()
-
-
-def write_files() -> None:
-    """Write the extracted data into output files."""
-    ent_txt = header + "entrance_table: list[str] = [\n"
-    for entrance in entrances:
-        ent_txt += f'    "{entrance}",\n'
-    ent_txt = ent_txt[:-2]
-    ent_txt += "\n    ]\n"
-
-    ref_txt = header + (
-        "refills: dict[str, tuple[int, int, int]] = {  "
-        "# key: region name. Tuple: [health restored, energy restored, refill type]\n"
-    )
-    ref_txt += "    # For refill type: 0 is no refill, 1 is Checkpoint, 2 is Full refill.\n"
-    for region, info in refills.items():
-        ref_txt += f'    "{region}": {info},\n'
-    ref_txt = ref_txt[:-2]
-    ref_txt += "\n    }\n\n" "refill_events: list[str] = [\n"
-    for refill_name in refill_events:
-        ref_txt += f'    "{refill_name}",\n'
-    ref_txt = ref_txt[:-2]
-    ref_txt += "\n    ]\n"
-
-    door_txt = header + "doors_vanilla: list[tuple[str, str]] = [  # Vanilla door connections\n"
-    for door in doors_vanilla:
-        door_txt += f"    {door},\n"
-    door_txt = door_txt[:-2]
-    door_txt += "\n    ]\n\n\n"
-    door_txt += "doors_map: dict[str, int] = {  # Mapping to door ID\n"
-    for door, value in doors_map.items():
-        door_txt += f'    "{door}": {value},\n'
-    door_txt = door_txt[:-2]
-    door_txt += "\n    }\n"
-
-    with open("Rules.py", "w") as w_file:
-        for j in range(7):
-            w_file.write(list_rules[j])
-        print("The file `Rules.py` has been successfully created.")
-    with open("Entrances.py", "w") as w_file:
-        w_file.write(ent_txt)
-        print("The file `Entrances.py` has been successfully created.")
-    with open("Refills.py", "w") as w_file:
-        w_file.write(ref_txt)
-        print("The file `Refills.py` has been successfully created.")
-    with open("DoorData.py", "w") as w_file:
-        w_file.write(door_txt)
-        print("The file `DoorData.py` has been successfully created.")
+# %% Helpers
 
 
-def parse_and() -> None:
-    """Parse the list of requirements in the `and` chain, and put the processed information in the and lists."""
-    global glitched, difficulty, and_req
-    global and_resource, and_skills, and_other
+def read_template(name: str) -> str:
+    """Return the code of the template copied in the generated files (see `templates`), without its docstring."""
+    with open(f"./templates/{name}.py") as file:
+        text = file.read()
+    return text[text.index('"""', 3) + 3 :].lstrip("\n")
 
-    # Reset the global values
-    glitched = False
-    and_skills = []  # Stores inf_skills
-    and_resource = []
-    and_other = []
 
-    for requirement in and_req:
-        if "=" in requirement:
-            elem, value = requirement.split("=")  # elem: type of path ; value: value associated
+def render_clause(
+    rule: Rule,
+    constants: Optional[dict[tuple, str]] = None,
+    costs: Optional[dict[tuple, str]] = None,
+    spawn: Optional[str] = "o.spawn.value",
+) -> str:
+    """
+    Return the expression of the requirements of this rule.
+
+    If a dictionary of constants is given, the resources are given as shared module constants (see `RuleEmitter`)
+    instead of lists built at each call. If a dictionary of costs is given, the resources are checked with their
+    precomputed costs when possible (see `clause_costs`), also given as module constants.
+    `spawn` is the expression of the spawn given to `can_open_door`, the keystone doors are not checked if it is None.
+    """
+    parts: list[str] = []  # Requirements, joined with `and`
+
+    if len(rule.skills) == 1:
+        parts.append(f's.has("{rule.skills[0]}", p)')
+    elif rule.skills:
+        parts.append("s.has_all((" + ", ".join(f'"{elem}"' for elem in rule.skills) + "), p)")
+
+    for elem in rule.other:
+        if "Keystone=" in elem:
+            if rule.target != "MidnightBurrows.Teleporter" and spawn is not None:
+                parts.append(f'can_open_door("{rule.target}", s, p, {spawn})')
+        elif "=" in elem:
+            req_name, amount = elem.split("=")
+            amount = int(amount)
+            if req_name == "SpiritLight":
+                if amount == 1200:  # Case of a shop item
+                    parts.append("can_buy_shop(s, p)")
+                else:  # Case of a map from Lupo
+                    parts.append("can_buy_map(s, p)")
+            elif req_name == "Ore":
+                parts.append(f's.count("Gorlek Ore", p) >= {amount}')
+            elif req_name == "Danger":
+                parts.append(f"has_enough_max_health(s, p, o, {amount})")
+            else:
+                raise ValueError(f"Invalid input: {elem}")
+        elif elem in other_glitches.keys():
+            parts.append(other_glitches[elem])
         else:
-            if requirement in name_convert.keys():
-                requirement = name_convert[requirement]
-            elem = requirement
-            value = "1"
-
-        # Handle the glitches
-        if elem in other_glitches.keys():  # Glitches that use a function
-            glitched = True
-            and_other.append(elem)
-        elif elem in inf_glitches.keys():  # Glitches that can be used infinitely and only use one skill
-            glitched = True
-            current_req = inf_glitches[elem]
-            if current_req not in and_skills and current_req != "free":
-                and_skills.append(current_req)
-        elif elem in energy_glitches.keys():
-            glitched = True
-            and_resource.append(("energy", (energy_glitches[elem], int(value))))
-        elif elem in wall_glitches.keys():
-            glitched = True
-            and_resource.append(("wall", (wall_glitches[elem], int(value))))
-
-        elif requirement in inf_skills:  # Check on requirement and not on elem to catch the energy skills without the =
-            if requirement not in and_skills and requirement != "free":
-                and_skills.append(requirement)
-        elif elem in en_skills:
-            and_resource.append(("energy", (elem, int(value))))
-        elif elem == "Damage":
-            and_resource.append(("db", int(value)))
-        elif elem in ("BreakWall", "Boss"):
-            and_resource.append(("wall", (elem, int(value))))
-        elif (
-            "Keystone=" in requirement
-            or "Ore=" in requirement
-            or "SpiritLight=" in requirement
-            or "Danger=" in requirement
-        ):  # Case of a keystone door, or spirit light, or ore, or danger value
-            and_other.append(requirement)
-        elif elem == "Combat":
-            and_resource += parse_combat(value)
-        else:  # Case of an event
-            and_skills.append(elem)
-
-
-def order_or(or_chain: list[str]) -> None:
-    """Parse the list of requirements in the `or` chain, and categorize them between skills and resources."""
-    global or_skills, or_glitch, or_resource
-
-    or_skills = []  # Store inf_skills (skills that don't require energy to use)
-    or_glitch = []  # Store the glitches
-    or_resource = []  # Store requirements that need resources
-
-    for requirement in or_chain:
-        if "=" in requirement:
-            elem, value = requirement.split("=")  # elem: type of path ; value: value associated
+            raise ValueError(f"Invalid input: {elem}")
+
+    if len(rule.any_skills) == 1:
+        parts.append(f's.has("{rule.any_skills[0]}", p)')
+    elif rule.any_skills:
+        parts.append("s.has_any((" + ", ".join(f'"{elem}"' for elem in rule.any_skills) + "), p)")
+
+    if rule.danger:  # Entering a new area: check that it can be entered
+        parts.append(f's.has("danger_{rule.danger}", p)')
+
+    options = clause_costs(rule) if costs is not None and (rule.resources or rule.or_resources) else None
+    if options is not None:
+        parts.append(
+            f'can_pay_costs({intern_resources(options, costs, "cost")}, "{rule.anchor}", s, p, o, '
+            f"{bool(rule.difficulty == 0)})"
+        )
+    elif rule.resources or rule.or_resources:
+        if constants is None:
+            resources, or_resources = str(list(rule.resources)), str(list(rule.or_resources))
         else:
-            if requirement in name_convert.keys():
-                requirement = name_convert[requirement]
-            elem = requirement
-            value = 0
-
-        # Find the glitches (not parsed here)
-        if (
-            elem in other_glitches.keys()
-            or elem in inf_glitches.keys()
-            or elem in energy_glitches.keys()
-            or elem in wall_glitches.keys()
-        ):
-            or_glitch.append(requirement)
+            resources = intern_resources(rule.resources, constants)
+            or_resources = intern_resources(rule.or_resources, constants)
+        parts.append(
+            f"has_enough_resources({resources}, {or_resources}, "
+            f'"{rule.anchor}", s, p, o, {bool(rule.difficulty == 0)})'
+        )
+
+    return " and ".join(parts) or "True"
 
-        elif requirement in inf_skills:  # Check on requirement and not on elem to catch the energy skills without the =
-            if requirement not in and_skills and requirement != "free":
-                or_skills.append(requirement)
-        elif elem in en_skills:
-            or_resource.append(("energy", (elem, int(value))))
-        elif elem == "Damage":
-            or_resource.append(("db", int(value)))
-        elif elem in ("BreakWall", "Boss"):
-            or_resource.append(("wall", (elem, int(value))))
-        elif elem == "Combat":
-            or_resource += parse_combat(value)
-        else:  # Case of an event
-            or_skills.append(elem)
-        # Keystone, Ore and Spirit Light never appear in an `or` chain
 
+def intern_resources(resources: tuple, constants: dict[tuple, str], prefix: str = "res") -> str:
+    """Return the name of the module constant holding these resources, and add it to the constants if it is new."""
+    if not resources:
+        return "()"
+    name = constants.get(resources)
+    if name is None:
+        name = constants[resources] = f"{prefix}_{len(constants)}"
+    return name
 
-def append_rule(use_or_resource: bool = True) -> None:
+
+def resource_costs(resource: tuple[str, Any]) -> Optional[list[tuple[frozenset[str], int, int]]]:
+    """
+    Return the ways to pay the resource, as (skills needed, energy in quarters, damage), or None if its cost depends
+    on more than the skills (walls, combat).
     """
-    Add the text to the rules list.
+    kind, value = resource
+    if kind == "db":
+        return [(frozenset(), 0, value)]
+    if kind != "energy":
+        return None
+    skill, amount = value
+    if skill in sentry_jumps:
+        return [(frozenset(("Sentry", weapon)), energy_costs["Sentry"] * amount, 0) for weapon in sentry_jumps[skill]]
+    return [(frozenset((skill,)), energy_costs[skill] * amount, 0)]
+
+
+def clause_costs(rule: Rule) -> Optional[tuple[tuple[tuple[str, ...], int, int], ...]]:
+    """
+    Return the precomputed costs of the resources of the clause, or None if they cannot be precomputed.
 
-    When use_or_resource is set to False, only the resources from the and chain are used.
-    This happens when looping through or_glitch or using the or_skills.
+    Each option holds the skills that must be owned, the energy (in quarters) and the damage: the resources can be
+    paid if one of the options can be. There is one option per choice of alternative resource and of Sentry jump
+    weapon, and the options costing more than another one are removed. The costs are the base costs, the modifiers
+    (shards, moki) and the refills of the anchor are still applied when checking them.
+    """
+    options = [(frozenset(), 0, 0)]
+    choices = [resource_costs(resource) for resource in rule.resources]
+    if rule.or_resources:
+        or_choices = [resource_costs(resource) for resource in rule.or_resources]
+        if None in or_choices:
+            return None
+        choices.append([choice for alternative in or_choices for choice in alternative])
+    for choice in choices:
+        if choice is None:
+            return None
+        options = [
+            (skills | extra, energy + more_energy, damage + more_damage)
+            for skills, energy, damage in options
+            for extra, more_energy, more_damage in choice
+        ]
+
+    kept: list[tuple[frozenset[str], int, int]] = []
+    for option in sorted(set(options), key=lambda option: (option[1], option[2], len(option[0]), sorted(option[0]))):
+        skills, energy, damage = option
+        if not any(other[0] <= skills and other[1] <= energy and other[2] <= damage for other in kept):
+            kept.append(option)
+    return tuple((tuple(sorted(skills)), energy, damage) for skills, energy, damage in kept)
+
+
+def render_rule(
+    rule: Rule, constants: Optional[dict[tuple, str]] = None, costs: Optional[dict[tuple, str]] = None
+) -> str:
+    """Return the text of the `add_rule` call for this rule (see `render_clause` for the constants and costs)."""
+    clause = render_clause(rule, constants, costs)
+    return f'    add_rule(w.get_entrance("{rule.entrance}"), lambda s: {clause}, "or")\n'
+
+
+def render_entrance(
+    rules: list[Rule],
+    constants: Optional[dict[tuple, str]] = None,
+    costs: Optional[dict[tuple, str]] = None,
+    location: bool = False,
+    predicates: Optional[dict[str, str]] = None,
+) -> str:
     """
-    global list_rules
+    Return the text of a single `add_rule` call for all these rules (of the same entrance and difficulty).
 
-    start_txt = f'    add_rule(w.get_entrance("{anchor} -> {path_name}"), lambda s: '
-    req_txt = ""
+    The clauses are joined with `or` in one expression (`and` has the priority), so evaluating the access rule only
+    takes one call instead of one nested call per clause. With `location`, the rule is added to the location (or
+    event) of the target instead of the entrance. See `render_clauses` for the predicates: a rule made of a single
+    predicate is bound with `partial` instead of a lambda.
+    """
+    clauses = render_clauses(rules, constants, costs, predicates=predicates)
+    if predicates is not None and re.fullmatch(r"pred_\d+\(p, o, s\)", clauses):
+        rule = f"partial({clauses[: clauses.index('(')]}, p, o)"
+    else:
+        rule = f"lambda s: {clauses}"
+    if location:
+        return f'    add_rule(w.get_location("{rules[0].target}"), {rule}, "or")\n'
+    return f'    add_rule(w.get_entrance("{rules[0].entrance}"), {rule}, "or")\n'
+
+
+def render_clauses(
+    rules: list[Rule],
+    constants: Optional[dict[tuple, str]] = None,
+    costs: Optional[dict[tuple, str]] = None,
+    spawn: Optional[str] = "o.spawn.value",
+    predicates: Optional[dict[str, str]] = None,
+) -> str:
+    """
+    Return the expression of the requirements of all these rules, joined with `or` (see `render_clause`).
 
-    if and_skills:
-        temp_txt = ""
-        if len(and_skills) == 1:
-            temp_txt = f's.has("{and_skills[0]}", p)'
-        else:
-            for elem in and_skills:
-                if temp_txt:
-                    temp_txt += f', "{elem}"'
-                else:
-                    temp_txt += f's.has_all(("{elem}"'
-            temp_txt += "), p)"
-        if req_txt:
-            req_txt += " and " + temp_txt
-        else:
-            req_txt += temp_txt
-
-    if and_other:
-        for elem in and_other:
-            temp_txt = ""
-            if "Keystone=" in elem:
-                if path_name != "MidnightBurrows.Teleporter":
-                    temp_txt = f'can_open_door("{path_name}", s, p, o.spawn.value)'
-            elif "=" in elem:
-                req_name, amount = elem.split("=")
-                amount = int(amount)
-                if req_name == "SpiritLight":
-                    if amount == 1200:  # Case of a shop item
-                        temp_txt = "can_buy_shop(s, p)"
-                    else:  # Case of a map from Lupo
-                        temp_txt = "can_buy_map(s, p)"
-                elif req_name == "Ore":
-                    temp_txt = f's.count("Gorlek Ore", p) >= {amount}'
-                elif req_name == "Danger":
-                    temp_txt = f"has_enough_max_health(s, p, o, {amount})"
-                else:
-                    raise ValueError(f"Invalid input: {elem}")
-            elif elem in other_glitches.keys():
-                temp_txt = other_glitches[elem]
+    If a dictionary of predicates is given, the clauses with several requirements are given as calls to module
+    functions of (player, options, state), named in the dictionary: identical clauses share the same function. The
+    clauses using a local `spawn` cannot be moved to a module function, they are kept inline.
+    """
+    clauses = [render_clause(rule, constants, costs, spawn) for rule in rules]
+    if predicates is not None and spawn in ("o.spawn.value", None):
+        clauses = [share_clause(clause, predicates) if " and " in clause else clause for clause in clauses]
+    return " or ".join(clauses)
+
+
+def share_clause(clause: str, predicates: dict[str, str]) -> str:
+    """Return the call to the predicate of the clause, and add it to the predicates if it is new."""
+    name = predicates.get(clause)
+    if name is None:
+        name = predicates[clause] = f"pred_{len(predicates)}"
+    return f"{name}(p, o, s)"
+
+
+def has_door(rule: Rule) -> bool:
+    """Return True if the rule checks a keystone door, which depends on the options (see `render_clause`)."""
+    return rule.target != "MidnightBurrows.Teleporter" and any("Keystone=" in elem for elem in rule.other)
+
+
+def other_codes(rule: Rule) -> tuple[tuple[int, Any], ...]:
+    """Return the codes of the checks that have their own function, in the same order as in `render_clause`."""
+    codes: list[tuple[int, Any]] = []
+    for elem in rule.other:
+        if "Keystone=" in elem:
+            if rule.target != "MidnightBurrows.Teleporter":
+                codes.append((DOOR, rule.target))
+        elif "=" in elem:
+            req_name, amount = elem.split("=")
+            amount = int(amount)
+            if req_name == "SpiritLight":
+                if amount == 1200:  # Case of a shop item
+                    codes.append((SHOP, 0))
+                else:  # Case of a map from Lupo
+                    codes.append((MAP, 0))
+            elif req_name == "Ore":
+                codes.append((ORE, amount))
+            elif req_name == "Danger":
+                codes.append((DANGER, amount))
             else:
                 raise ValueError(f"Invalid input: {elem}")
-            if req_txt and temp_txt:
-                req_txt += " and " + temp_txt
-            else:
-                req_txt += temp_txt
-
-    if or_skills and not use_or_resource:
-        temp_txt = ""
-        if len(or_skills) == 1:
-            temp_txt = f's.has("{or_skills[0]}", p)'
+        elif elem in other_glitches.keys():
+            codes.append((GLITCH, other_glitches[elem].split("(")[0]))  # Name of the function
         else:
-            for elem in or_skills:
-                if temp_txt:
-                    temp_txt += f', "{elem}"'
-                else:
-                    temp_txt += f's.has_any(("{elem}"'
-            temp_txt += "), p)"
-        if req_txt:
-            req_txt += " and " + temp_txt
-        else:
-            req_txt += temp_txt
+            raise ValueError(f"Invalid input: {elem}")
+    return tuple(codes)
 
-    if target_area:  # Entering a new area: check that it can be entered
-        if req_txt:
-            req_txt += " and " + f's.has("danger_{target_area}", p)'
-        else:
-            req_txt += f's.has("danger_{target_area}", p)'
 
-    if use_or_resource:
-        used_or_res = or_resource
-    else:
-        used_or_res = []
-    if and_resource or used_or_res:
-        temp_txt = (
-            f'has_enough_resources({and_resource}, {used_or_res}, "{anchor}", s, p, o, ' f"{bool(difficulty == 0)})"
-        )
-        if req_txt:
-            req_txt += " and " + temp_txt
+def requirement_row(rule: Rule) -> tuple:
+    """
+    Return the requirements of the rule as a row of data: skills (all needed), skills (one needed), other checks (see
+    `other_codes`), danger event, resources, or resources, moki.
+    """
+    danger = f"danger_{rule.danger}" if rule.danger else ""
+    return (
+        rule.skills,
+        rule.any_skills,
+        other_codes(rule),
+        danger,
+        rule.resources,
+        rule.or_resources,
+        rule.difficulty == 0,
+    )
+
+
+def referenced_names(rule: Rule) -> list[str]:
+    """
+    Return the names of the items and events that the rule mentions, without duplicates.
+
+    The glitches give the items they use (see `glitch_items`), and the checks with their own function the item they
+    count (`Keystone`, `Spirit Light`, `Gorlek Ore`, `Health Fragment`). The energy gives the skills using it and
+    `Energy Fragment`, the damage gives `Health Fragment`, and the walls and the combat give the weapons that can be
+    used (see `weapons`) and both fragments.
+    """
+    names: list[str] = []
+    for elem in rule.skills + rule.any_skills + rule.other:
+        if elem in glitch_items:
+            names.extend(item for option in glitch_items[elem] for item in option)
+        elif "Keystone=" in elem and rule.target == "MidnightBurrows.Teleporter":
+            continue  # This door is not checked (see `render_clause`)
+        elif "=" in elem:
+            names.append(other_items[elem.split("=")[0]])
+        else:
+            names.append(elem)
+    if rule.danger:
+        names.append(f"danger_{rule.danger}")
+    for kind, value in rule.resources + rule.or_resources:
+        if kind == "energy":
+            names.extend(sentry_jumps[value[0]] + ("Sentry",) if value[0] in sentry_jumps else (value[0],))
+            names.append("Energy Fragment")
+        elif kind == "db":
+            names.append("Health Fragment")
         else:
-            req_txt += temp_txt
+            if kind == "wall" and value[0] in wall_glitches.values():
+                names.append(value[0].title())  # Glitched wall break, with Shuriken or Sentry
+            else:
+                names.extend(weapons)
+            names.extend(("Energy Fragment", "Health Fragment"))
+    return list(dict.fromkeys(names))
 
-    if req_txt:
-        tot_txt = start_txt + req_txt + ', "or")\n'
-    else:
-        tot_txt = start_txt + 'True, "or")\n'
 
-    if glitched:
-        difficulty_index = difficulty + 1
-    else:
-        difficulty_index = difficulty
+def is_resource(requirement: str) -> bool:
+    """Return whether the requirement of `areas.wotw` has a cost (energy, damage, wall or combat)."""
+    elem = requirement.split("=")[0]
+    if elem in en_skills:
+        return "=" in requirement  # Without a number of uses, the energy skill is only needed
+    return elem in energy_glitches or elem in wall_glitches or elem in combat_name or elem == "Damage"
 
-    list_rules[difficulty_index] += tot_txt
 
+def trick_mask(rule: Rule) -> int:
+    """Return the mask of the tricks used by the rule (0 if it has no glitch)."""
+    mask = 0
+    for glitch in rule.glitches:
+        mask |= trick_bits[glitch]
+    return mask
 
-def create_door_rules() -> None:
-    """Add to list_rules and the entrances some connection rules for the doors."""
-    global anchor, path_name, list_rules, entrances
-    dot_position = anchor.find(".")
-    area = anchor[:dot_position]  # Extract the name of the area
-    # Link the door to the anchor (the connection from anchor to door can have a rule and is done in append_rule)
-    # Also check for the region requirements when exiting a door
-    if area in regions_free:
-        list_rules[0] += f'    add_rule(w.get_entrance("{anchor} (Door) -> {anchor}"), lambda s: True, "or")\n'
-    else:
-        list_rules[0] += (
-            f'    add_rule(w.get_entrance("{anchor} (Door) -> {anchor}"), '
-            f'lambda s: s.has("danger_{area}", p), "or")\n'
-        )
-    entrances.append(f"{anchor} (Door) -> {anchor}")
+
+def is_refill(rule: Rule) -> bool:
+    """Return True if the rule gives access to a refill of its anchor (i.e. the `H.`, `E.`, `C.` or `F.` events)."""
+    return rule.target[:2] in refill_prefixes and rule.target[2:] == rule.anchor
 
 
 def parse_combat(content: str) -> list[tuple[str, str]]:
-    """Parse the combat requirement with the given enemies, return a list to add to the resources."""
+    """
+    Parse the combat requirement with the given enemies, return a list to add to the resources.
+
+    Each enemy is given once per fight, i.e. `("combat", enemy)` (see `count_combat` for the counted entries).
+    """
     result: list[tuple[str, str]] = []
     enemies = content.split("+")
 
@@ -580,288 +593,1394 @@ def parse_combat(content: str) -> list[tuple[str, str]]:
     return result
 
 
-# %% Main script
+def count_resources(resources: tuple[tuple[str, Any], ...]) -> tuple[tuple[str, Any], ...]:
+    """Return the resources with the combat entries merged per enemy, i.e. `("combat", (enemy, count))`."""
+    counts: dict[str, int] = {}
+    for kind, value in resources:
+        if kind == "combat":
+            counts[value] = counts.get(value, 0) + 1
+    others = tuple(resource for resource in resources if resource[0] != "combat")
+    return others + tuple(("combat", (enemy, count)) for enemy, count in counts.items())
 
 
-# Note: the code in this section is very messy and hard to understand. I might refactor it at some point to solve that.
-# It is probably best to reach out to me and ask me questions about how this work rather than figuring out yourself.
+def count_combat(rule: Rule) -> Rule:
+    """Return the rule with its combat requirements given once per enemy, with the number of fights."""
+    return rule._replace(resources=count_resources(rule.resources), or_resources=count_resources(rule.or_resources))
 
 
-with open("./areas.wotw", "r") as file:
-    source_text = file.readlines()
+def combat_enemies(rule: Rule) -> list[str]:
+    """Return the enemies that the rule fights (with `count_combat` entries or not)."""
+    values = [value for kind, value in rule.resources + rule.or_resources if kind == "combat"]
+    return [value[0] if isinstance(value, tuple) else value for value in values]
 
-# Moki, Gorlek, Kii and Unsafe rules respectively
-moki = (
-    header + imports + 'def set_moki_rules(w: "WotWWorld"):\n'
-    '    """Moki (or easy, default) rules."""\n'
-    "    p = w.player\n"
-    "    o = w.options\n"
-)
-gorlek = (
-    '\n\ndef set_gorlek_rules(w: "WotWWorld"):\n'
-    '    """Gorlek (or medium) rules."""\n'
-    "    p = w.player\n"
-    "    o = w.options\n"
-)
-gorlek_glitch = (
-    '\n\ndef set_gorlek_glitched_rules(w: "WotWWorld"):\n'
-    '    """Gorlek (or medium) rules with glitches"""\n'
-    "    p = w.player\n"
-    "    o = w.options\n"
-)
-kii = (
-    '\n\ndef set_kii_rules(w: "WotWWorld"):\n'
-    '    """Kii (or hard) rules"""\n'
-    "    p = w.player\n"
-    "    o = w.options\n"
-)
-kii_glitch = (
-    '\n\ndef set_kii_glitched_rules(w: "WotWWorld"):\n'
-    '    """Kii (or hard) rules with glitches."""\n'
-    "    p = w.player\n"
-    "    o = w.options\n"
-)
-unsafe = (
-    '\n\ndef set_unsafe_rules(w: "WotWWorld"):\n' '    """Unsafe rules."""\n' "    p = w.player\n" "    o = w.options\n"
-)
-unsafe_glitch = (
-    '\n\ndef set_unsafe_glitched_rules(w: "WotWWorld"):\n'
-    '    """Unsafe rules with glitches."""\n'
-    "    p = w.player\n"
-    "    o = w.options\n"
-)
 
-# Store the parsed text for each difficulty
-list_rules: list[str] = [moki, gorlek, gorlek_glitch, kii, kii_glitch, unsafe, unsafe_glitch]
-# Store the entrance names
-entrances: list[str] = []
-# Contain the refill info per region in a tuple: (health, energy, type)
-refills: dict[str, tuple[int, int, int]] = {}
-refill_events: list[str] = []  # Store all the names given to the refill events.
-doors_map: dict[str, int] = {}  # Mapping from door name to door ID
-doors_vanilla: list[tuple[str, str]] = []  # Vanilla connections between the doors
-
-# Global variables
-indent = 0  # Number of indents
-anchor = ""  # Name of the current anchor
-glitched = False  # Whether the current path involves glitches
-difficulty = 0  # Difficulty of the path
-req = ""  # Full requirement
-req1 = ""  # Requirements from first indent
-req2 = ""  # Requirements from second indent
-req3 = ""  # Requirements from third indent
-req4 = ""  # Requirements from fourth indent
-req5 = ""  # Requirements from fifth indent
-refill_type = ""  # Refill type (energy, health, checkpoint or full)
-path_type = ""  # Type of the path (connection, pickup, refill)
-path_name = ""  # Name of the location/region/event accessed by the path
-should_convert = False  # If True, convert is called to create a rule
-is_door = False  # True while parsing a door
-is_enter = False  # True when in an enter clause (when parsing the door rules)
-door_id = 0
-is_region = False  # True when parsing a region requirement
-and_req: list[str] = []  # Stores the requirements form an and chain (i.e. coma separated requirements)
-and_skills: list[str] = []  # Store the skills, events from the and chain
-and_other: list[str] = []  # Store the requirements that have their own fonction (some glitches, keys, shops...)
-and_resource: list[tuple[str, any]] = []  # Store the requirements that involve resources from the and chain
-or_req: list[list[str]] = []  # Stores the requirements from each OR chain
-
-
-or_skills: list[str] = []
-or_resource: list[tuple[str, any]] = []
-or_glitch: list[str] = []
-
-target_area = ""  # Area of the path_name anchor
-
-convert_diff = {"moki": 0, "gorlek": 1, "kii": 3, "unsafe": 5}
-
-for i, line in enumerate(source_text):  # Line number is only used for debug
-    should_convert = False  # Reset the flag to false
-
-    # Parse the line text
-    m = r_comment.search(line)  # Remove the comments
-    if m:
-        line = line[: m.start()]
-    m = r_trailing.search(line)  # Remove the trailing spaces
-    if m:
-        line = line[: m.start()]
-    if line == "":
-        continue
-
-    m = r_indent.match(line)  # Count the indents
-    if m is None:
-        indent = 0
-    else:
-        indent = (m.end() + 1) // 2
-        line = line[m.end() :]  # Remove the indents from the text
-        if is_enter:  # When in parsing a door connection, there is one extra indent, it is easier to remove it there
-            if indent < 3:  # Exited from enter clause, so set it to false
-                is_enter = False
-            else:  # Remove the extra indent to avoid adding new cases
-                indent -= 1
-
-    if indent == 0:  # Always anchor, except for requirement or region (which are ignored)
-        req1, req2, req3, req4, req5 = "", "", "", "", ""
-        is_region = False
-        if "anchor" in line:
-            name = try_group(r_colon, line, 1, -1)  # the space and colon are captured, to remove them with 1, -1
-            s = r_separate.search(name)  # Detect and remove the ` at <coord>` part if it exists.
-            if s:
-                anchor = name[: s.start()]
-            else:
-                anchor = name
-            refills.setdefault(anchor, (0, 0, 0))
-        elif "region" in line:
-            anchor = "Menu"
-            region_name = try_group(r_colon, line, 1, -1)
-            path_name = f"danger_{region_name}"
-            path_type = "conn"
-            is_region = True
+def write_combat_costs(out_dir: str, enemies: Iterable[str], path: str) -> None:
+    """
+    Write `CombatCosts.py` with the cost of fighting each enemy, from the enemy data file at `path`.
+
+    Each line of the file holds the enemy name, then the energy and the damage for each difficulty (moki, gorlek, kii,
+    unsafe), separated with commas (the first line is the header). With these costs, a `("combat", (enemy, count))`
+    requirement is a multiplication (see `count_combat`). The `enemies` of the rules missing from the file are printed.
+    """
+    costs: dict[str, tuple[tuple[int, int], ...]] = {}
+    with open(path, "r") as file:
+        for line in file.readlines()[1:]:
+            data = line.strip().split(",")
+            if len(data) != 9:
+                raise ValueError(f"Invalid line in `{path}`: {line}")
+            values = [int(value) for value in data[1:]]
+            costs[data[0]] = tuple(zip(values[::2], values[1::2]))
+
+    missing = sorted(set(enemies) - costs.keys())
+    if missing:
+        print(f"Warning: no combat cost for {', '.join(missing)}.")
+
+    with open(os.path.join(out_dir, "CombatCosts.py"), "w") as w_file:
+        w_file.write(
+            header + "combat_costs: dict[str, tuple[tuple[int, int], ...]] = {  "
+            "# key: enemy. Tuple: (energy, damage) for moki, gorlek, kii and unsafe\n"
+        )
+        write_items(w_file, (f'    "{enemy}": {cost}' for enemy, cost in costs.items()))
+        w_file.write("\n    }\n")
+        print("The file `CombatCosts.py` has been successfully created.")
+
+
+# %% Emission
+
+
+class EmitOptions(NamedTuple):
+    """Options of the generated rules, the default ones give the legacy `Rules.py`."""
+
+    simplify: bool = True  # Simplify the rules of each anchor together (see `simplify.py`)
+    coalesce: bool = True  # Write a single `add_rule` call per entrance and rule set, instead of one per clause
+    refill_events: bool = True  # Write the refills as events, else as data in `Refills.py` (see `write_refills`)
+    costs: bool = False  # Check the energy and damage with precomputed costs when possible (see `clause_costs`)
+    trick_masks: bool = False  # Only add the glitched clauses of the enabled tricks (see `write_tricks`)
+    split: bool = False  # Write each rule set in its own module, imported when needed (see `write_split`)
+    factories: bool = False  # Write rule functions shared by the worlds with the same options (see `RuleFactories`)
+    specialize: bool = False  # With `factories`, write a variant of the rules reading the options for each value
+    location_rules: bool = False  # Add the rules of the pickups with a single anchor to their location
+    shared_clauses: bool = False  # Write the clauses used by several rules once (see `SharedClauses`)
+    item_index: bool = False  # Write the entrances depending on each item in `ItemEntrances.py` (see `ItemIndex`)
+    combat_counts: bool = False  # Write the combat requirements as `(enemy, count)` entries (see `count_combat`)
+    combat_data: Optional[str] = None  # Path of the enemy data, to write `CombatCosts.py` (see `write_combat_costs`)
+
+
+def tier_header(tier: int, trick_masks: bool) -> str:
+    """Return the header of the rule function of the rule set, with the mask of the enabled tricks if `trick_masks`."""
+    if trick_masks and tier in glitched_tiers:
+        return rule_headers[tier].replace('"WotWWorld"):', '"WotWWorld", tricks: int = all_tricks):')
+    return rule_headers[tier]
+
+
+def write_tricks(w_file: TextIO) -> None:
+    """Write the bit of each trick, and the mask of all the tricks."""
+    w_file.write(
+        "# Bit of each trick in the mask given to the glitched rule functions (Unpopular is a separate toggle)\n"
+        "trick_bits: dict[str, int] = {\n"
+    )
+    write_items(w_file, (f'    "{name}": 1 << {bit}' for bit, name in enumerate(trick_bits)))
+    w_file.write(f"\n    }}\nall_tricks = {sum(trick_bits.values())}\n\n\n")
+
+
+def write_locations(w_file: TextIO, located: Iterable[str]) -> None:
+    """Write the locations whose rules are added to the location, and the function resetting their rules."""
+    w_file.write(
+        "# Locations whose rules are added by the rule functions: their default rule (always true) is replaced\n"
+        "# with False by `reset_locations`, called before the moki rules are added.\n"
+        "rule_locations: tuple[str, ...] = (\n"
+    )
+    for name in sorted(located):
+        w_file.write(f'    "{name}",\n')
+    w_file.write("    )\n\n\n")
+    w_file.write(reset_locations)
+
+
+class SharedClauses:
+    """Clauses hash-consed into module functions while rendering (see `render_clauses`)."""
+
+    def __init__(self) -> None:
+        self.predicates: dict[str, str] = {}  # Name of the function of each clause
+        self.shared: dict[str, str] = {}  # Clause of each function kept by `share`
+        self.uses = 0  # Number of calls to the functions kept
+
+    def share(self, buffers: list[TextIO]) -> list[TextIO]:
+        """
+        Return the rendered rules with the functions used once written back inline, and the others renumbered in the
+        order of their first use. The buffers are closed.
+        """
+        bodies = []
+        for buffer in buffers:
+            buffer.seek(0)
+            bodies.append(buffer.read())
+            buffer.close()
+        uses = Counter(name for body in bodies for name in re.findall(r"\bpred_\d+\b", body))
+        clauses = {name: clause for clause, name in self.predicates.items()}
+        names: dict[str, str] = {}  # New name of each kept function
+        for name, count in uses.items():
+            if count > 1:
+                names[name] = f"pred_{len(names)}"
+                self.shared[names[name]] = clauses[name]
+                self.uses += count
+
+        def replace(match: re.Match) -> str:
+            bound, name = match.group(1), match.group(1) or match.group(2)
+            if bound:  # The rules made of a single function are bound with `partial`
+                return f"partial({names[name]}, p, o)" if name in names else f"lambda s: {clauses[name]}"
+            return f"{names[name]}(p, o, s)" if name in names else clauses[name]
+
+        pattern = r"partial\((pred_\d+), p, o\)|\b(pred_\d+)\(p, o, s\)"
+        return [io.StringIO(re.sub(pattern, replace, body)) for body in bodies]
+
+    def write(self, w_file: TextIO, used: Optional[set[str]] = None) -> None:
+        """Write the functions kept (or only the `used` ones)."""
+        shared = [(name, clause) for name, clause in self.shared.items() if used is None or name in used]
+        if shared:
+            w_file.write("# Clauses used by several rules, written once (see `SharedClauses`)\n")
+            for name, clause in shared:
+                w_file.write(f"def {name}(p, o, s) -> bool:\n    return {clause}\n\n\n")
+
+
+class ItemIndex:
+    """Entrances (or locations) whose rules depend on each item or event (see `referenced_names`)."""
+
+    def __init__(self) -> None:
+        self.dependents: dict[str, dict[str, None]] = {}  # Ordered set of the spots of each name
+
+    def add(self, spot: str, rules: list[Rule]) -> None:
+        """Add the entrance (or location) to the names that its rules depend on."""
+        for rule in rules:
+            for name in referenced_names(rule):
+                self.dependents.setdefault(name, {})[spot] = None
+
+    def write(self, out_dir: str) -> None:
+        """Write `ItemEntrances.py` in the `out_dir` folder."""
+        with open(os.path.join(out_dir, "ItemEntrances.py"), "w") as w_file:
+            w_file.write(
+                header + "# Entrances (or locations, see `Entrances.py`) whose rules depend on each item or event,\n"
+                "# with the items used by the glitches, walls and combat (see `referenced_names` in\n"
+                "# `extract_rules.py`), in any difficulty. When a state collects an item, only the access rules of\n"
+                "# these entrances can change.\n"
+                "item_entrances: dict[str, tuple[str, ...]] = {\n"
+            )
+            for name, spots in sorted(self.dependents.items()):
+                w_file.write(f'    "{name}": (\n')
+                for spot in spots:
+                    w_file.write(f'        "{spot}",\n')
+                w_file.write("        ),\n")
+            w_file.write("    }\n")
+        print("The file `ItemEntrances.py` has been successfully created.")
+        links = sum(len(spots) for spots in self.dependents.values())
+        print(f"    Item index: {len(self.dependents)} names, {links} links to the entrances.")
+
+
+class RuleFactories:
+    """Rule functions of (player, options, state) listed in `tier_rules`, and bound to the worlds with `partial`."""
+
+    def __init__(self, specialize: bool) -> None:
+        self.specialize = specialize
+        self.rows: list[list[tuple[str, int, str, bool]]] = [[] for _ in rule_headers]  # See `tier_rules`
+        self.functions = 0  # Number of rule functions
+        self.variants = 0  # Number of rule functions with option variants
+
+    def render(
+        self,
+        tier: int,
+        spot: str,
+        mask: int,
+        rules: list[Rule],
+        constants: dict[tuple, str],
+        costs: Optional[dict[tuple, str]],
+        predicates: Optional[dict[str, str]],
+    ) -> str:
+        """
+        Return the rule function of the rules, and add its row. With `specialize`, the rules checking a keystone door
+        give a function returning the rule function for (spawn, keystone doors).
+        """
+        name = f"_r{self.functions}"
+        self.functions += 1
+        specialized = self.specialize and any(has_door(rule) for rule in rules)
+        self.rows[tier].append((spot, mask, name, specialized))
+        if not specialized:
+            clauses = render_clauses(rules, constants, costs, predicates=predicates)
+            return f"def {name}(p, o, s):\n    return {clauses}\n\n\n"
+        self.variants += 1
+        return (
+            f"def {name}(spawn: int, keystone_doors: bool) -> Callable:\n"
+            "    if keystone_doors:\n"
+            "        def rule(p, o, s):\n"
+            f"            return {render_clauses(rules, constants, costs, 'spawn')}\n"
+            "    else:\n"
+            "        def rule(p, o, s):\n"
+            f"            return {render_clauses(rules, constants, costs, None, predicates)}\n"
+            "    return rule\n\n\n"
+        )
+
+    def write(self, w_file: TextIO, buffers: list[TextIO]) -> None:
+        """Write the rule functions, their table, and the functions binding them to the worlds."""
+        for buffer in buffers:
+            shutil.copyfileobj(buffer, w_file)
+        w_file.write(
+            "# Rules of each rule set, in the order of the `set_*_rules` functions. Each row contains: entrance (or\n"
+            "# location, see `get_spot`), mask of the tricks used (see `trick_bits`, 0 if none), rule function of\n"
+            "# (player, options, state), and whether the function is specialized (it then returns the rule function\n"
+            "# for (spawn, keystone doors)).\n"
+            "tier_rules: tuple[tuple[tuple[str, int, Callable, bool], ...], ...] = (\n"
+        )
+        for name, rows in zip(tier_names, self.rows):
+            w_file.write(f"    (  # {name}\n")
+            for entrance, mask, function, specialized in rows:
+                w_file.write(f'        ("{entrance}", {mask}, {function}, {specialized}),\n')
+            w_file.write("    ),\n")
+        w_file.write("    )\n\n")
+        w_file.write(
+            f"\ntier_levels = {tier_levels}  # Difficulty of each rule set (0: moki, 1: gorlek, 2: kii, 3: unsafe)\n"
+            f"glitched_tiers = {tuple(sorted(glitched_tiers))}  # Rule sets with glitches\n"
+        )
+        w_file.write(read_template("factories"))
+        for tier, name in enumerate(tier_names):
+            w_file.write(
+                f'\n\ndef set_{name}_rules(w: "WotWWorld", tricks: int = -1, keystone_doors: bool = True):\n'
+                f"    add_tier_rules(w, {tier}, tricks, keystone_doors)\n"
+            )
+
 
+class RuleEmitter:
+    """
+    Stream the rendered rules into one temporary file per rule set, and write them in `Rules.py` (see `EmitOptions`).
+
+    The temporary files stay in memory until they reach `spool_size` characters, then they are moved to the disk.
+    """
+
+    spool_size = 1 << 20
+
+    def __init__(self, options: EmitOptions = EmitOptions(), placements: Optional[dict[str, list[str]]] = None) -> None:
+        if options.split and options.factories:
+            raise ValueError("The rule factories cannot be split into several modules.")
+        if options.specialize and not options.factories:
+            raise ValueError("The option variants are only written with the rule factories.")
+        if options.location_rules and placements is None:
+            raise ValueError("The location rules need the anchors of the pickups, states and quests.")
+        self.options = options
+        self.buffers: list[TextIO] = [tempfile.SpooledTemporaryFile(self.spool_size, mode="w+") for _ in rule_headers]
+        self.pending: list[Rule] = []  # Rules of the current anchor
+        self.placements = placements if options.location_rules else None  # Anchors of the pickups, states and quests
+        self.located: set[str] = set()  # Pickups, states and quests whose rules are added to their location
+        self.refill_rules: list[Rule] = []  # Rules of the refills, when they are written as data
+        self.constants: dict[tuple, str] = {}  # Name of the constant holding each tuple of resources
+        self.costs: Optional[dict[tuple, str]] = {} if options.costs else None  # Name of the constant of each cost
+        self.enemies: set[str] = set()  # Enemies fought by the rules, with `combat_data`
+        self.factories = RuleFactories(options.specialize) if options.factories else None
+        self.shared_clauses = SharedClauses() if options.shared_clauses else None
+        self.item_index = ItemIndex() if options.item_index else None
+        # Statistics
+        self.stats: Counter = Counter()  # Number of clauses removed by the simplification, per reason
+        self.pruned = [Counter() for _ in rule_headers]  # Clauses removed by the cross-difficulty pruning
+        self.cost_stats: Counter = Counter()  # Clauses with resources, with and without precomputed costs
+        self.masks: Counter = Counter()  # Number of glitched clauses for each trick mask
+
+    def add(self, rule: Rule) -> None:
+        """Add the rule, the rules are rendered when all the rules of its anchor are known."""
+        if self.pending and self.pending[-1].anchor != rule.anchor:
+            self.flush()
+        self.pending.append(rule)
+
+    def flush(self) -> None:
+        """Render the pending rules and write them in the buffer of their rule set."""
+        options = self.options
+        rules = self.pending
+        if options.simplify:
+            rules = simplify_rules(rules, self.stats, options.trick_masks)
+            rules = prune_tiers(rules, self.pruned, options.trick_masks)
+        if options.combat_counts:
+            rules = [count_combat(rule) for rule in rules]
+        if options.combat_data is not None:
+            for rule in rules:
+                self.enemies.update(combat_enemies(rule))
+        if not options.refill_events:
+            self.refill_rules += [rule for rule in rules if is_refill(rule)]
+            rules = [rule for rule in rules if not is_refill(rule)]
+        if self.costs is not None:
+            for rule in rules:
+                if rule.resources or rule.or_resources:
+                    self.cost_stats["precomputed" if clause_costs(rule) is not None else "runtime"] += 1
+        if options.coalesce:
+            groups: dict[tuple[int, str, int], list[Rule]] = {}  # Rules of each rule set, entrance and trick mask
+            for rule in rules:
+                mask = trick_mask(rule) if options.trick_masks else 0
+                groups.setdefault((rule.tier, rule.entrance, mask), []).append(rule)
+            for (tier, _, mask), group in groups.items():
+                self.write_rule(tier, mask, group)
+        else:
+            for rule in rules:
+                self.write_rule(rule.tier, trick_mask(rule) if options.trick_masks else 0, [rule])
+        self.pending = []
+
+    def write_rule(self, tier: int, mask: int, rules: list[Rule]) -> None:
+        """Write the rules of the same entrance in the buffer of their rule set, for the tricks of the mask."""
+        if mask:
+            self.masks[mask] += 1
+        target = rules[0].target
+        location = self.placements is not None and len(self.placements.get(target, ())) == 1
+        if location:
+            self.located.add(target)
+        spot = target if location else rules[0].entrance
+        if self.item_index is not None:
+            self.item_index.add(spot, rules)
+        predicates = self.shared_clauses.predicates if self.shared_clauses is not None else None
+        if self.factories is not None:
+            self.buffers[tier].write(
+                self.factories.render(tier, spot, mask, rules, self.constants, self.costs, predicates)
+            )
+            return
+        text = render_entrance(rules, self.constants, self.costs, location, predicates)
+        if mask:
+            self.buffers[tier].write(f"    if tricks & {mask} == {mask}:\n    {text}")
         else:
-            anchor = ""
+            self.buffers[tier].write(text)
+
+    def module_imports(self, resets: bool = True) -> str:
+        """Return the imports of a module of rule functions (with `set_rule` if it resets the located locations)."""
+        if resets and (self.located or self.factories is not None):
+            return imports.replace("import add_rule\n", "import add_rule, set_rule\n")
+        return imports
+
+    def write_constants(self, w_file: TextIO, used: Optional[set[str]] = None) -> None:
+        """Write the module constants of the resources and costs, and the shared clauses (or only the `used` ones)."""
+        constants = [(value, name) for value, name in self.constants.items() if used is None or name in used]
+        if constants:
+            w_file.write("# Resources of the `has_enough_resources` calls, shared by all the rules\n")
+            for resources, name in constants:
+                w_file.write(f"{name} = {resources}\n")
+            w_file.write("\n\n")
+        costs = [(value, name) for value, name in (self.costs or {}).items() if used is None or name in used]
+        if costs:
+            w_file.write(
+                "# Precomputed costs of the `can_pay_costs` calls. Each option holds the skills needed, the\n"
+                "# energy (in quarters) and the damage, before the modifiers and the refills.\n"
+            )
+            for options, name in costs:
+                w_file.write(f"{name} = {options}\n")
+            w_file.write("\n\n")
+        if self.shared_clauses is not None:
+            self.shared_clauses.write(w_file, used)
+
+    def write(self, path: str) -> None:
+        """Write the rule functions into the file (or next to it with `split`), and close the buffers."""
+        self.flush()
+        if self.shared_clauses is not None:
+            self.buffers = self.shared_clauses.share(self.buffers)
+        for buffer in self.buffers:
+            buffer.seek(0)
+        if self.options.split:
+            write_split(path, self)
+        else:
+            with open(path, "w") as w_file:
+                self.write_module(w_file)
+        for buffer in self.buffers:
+            buffer.close()
+
+    def write_module(self, w_file: TextIO) -> None:
+        """Write all the rule functions in a single module."""
+        if self.factories is not None:
+            w_file.write(header + "from functools import partial\nfrom typing import Callable\n\n")
+        elif self.shared_clauses is not None and self.shared_clauses.shared:
+            w_file.write(header + "from functools import partial\n\n")
+        else:
+            w_file.write(header)
+        w_file.write(self.module_imports())
+        self.write_constants(w_file)
+        if self.options.trick_masks:
+            write_tricks(w_file)
+        if self.located or self.factories is not None:  # The factories always reset the located locations
+            write_locations(w_file, self.located)
+        if self.factories is not None:
+            self.factories.write(w_file, self.buffers)
+            return
+        for tier, buffer in enumerate(self.buffers):
+            w_file.write(tier_header(tier, self.options.trick_masks))
+            if tier == 0 and self.located:
+                w_file.write("    reset_locations(w)\n")
+            shutil.copyfileobj(buffer, w_file)
+
+    def print_stats(self, or_chains: Counter) -> None:
+        """Print the statistics of the emitted rules, and of the requirements with several `or` chains."""
+        if self.stats:
+            removed = sum(self.stats.values()) - self.stats["cleaned"]
+            print(f"    Simplification: {removed} clauses removed ({dict(self.stats)}).")
+        if or_chains["lines"]:
+            print(
+                f"    Requirements with several `or` chains: {or_chains['lines']}, making {or_chains['clauses']} "
+                f"clauses (instead of {or_chains['legacy']} with the former splitting; {or_chains['factored']} "
+                "factored into one chain)."
+            )
+        if any(self.pruned):
+            print("    Cross-difficulty pruning (clauses removed, resource checks removed):")
+            for name, pruned in zip(tier_names, self.pruned):
+                if pruned:
+                    print(f"        {name}: {pruned['clauses']}, {pruned['resources']}")
+        if self.cost_stats:
+            print(
+                f"    Precomputed costs: {self.cost_stats['precomputed']} clauses ({len(self.costs)} distinct "
+                f"costs), {self.cost_stats['runtime']} clauses with walls or combat left to `has_enough_resources`."
+            )
+        if self.masks:
+            print(
+                f"    Trick masks: {sum(self.masks.values())} glitched `add_rule` calls, with {len(self.masks)} "
+                "distinct sets of tricks."
+            )
+        if self.factories is not None and self.factories.variants:
+            print(
+                f"    Option variants: {self.factories.variants} of the {self.factories.functions} rule functions are "
+                "specialized."
+            )
+        if self.shared_clauses is not None:
+            shared = self.shared_clauses
+            print(
+                f"    Shared clauses: {len(shared.shared)} clause functions for {shared.uses} calls "
+                f"({len(shared.predicates) - len(shared.shared)} clauses used once written inline)."
+            )
+
+
+def write_split(path: str, emitter: RuleEmitter) -> None:
+    """Write each rule function in its own module next to the file (see `tier_modules`), and the dispatcher in it."""
+    dispatcher = os.path.splitext(os.path.basename(path))[0]
+    trick_masks = emitter.options.trick_masks
+    shared = emitter.shared_clauses.shared if emitter.shared_clauses is not None else {}
+    for tier, (module, buffer) in enumerate(zip(tier_modules, emitter.buffers)):
+        body = buffer.read()
+        with open(os.path.join(os.path.dirname(path), f"{module}.py"), "w") as w_file:
+            w_file.write(header)
+            if "partial(" in body:
+                w_file.write("from functools import partial\n")
+            if trick_masks and tier in glitched_tiers:
+                w_file.write(f"from .{dispatcher} import all_tricks\n")
+            w_file.write(emitter.module_imports(tier == 0))
+            used = set(re.findall(r"\bpred_\d+\b", body))  # Only the constants used by the module are written
+            used.update(re.findall(r"\b(?:res|cost)_\d+\b", body + "".join(shared[name] for name in used)))
+            emitter.write_constants(w_file, used)
+            if tier == 0 and emitter.located:
+                write_locations(w_file, emitter.located)
+            w_file.write(tier_header(tier, trick_masks).lstrip("\n"))
+            if tier == 0 and emitter.located:
+                w_file.write("    reset_locations(w)\n")
+            w_file.write(body)
+
+    with open(path, "w") as w_file:
+        w_file.write(header + dispatcher_imports)
+        if trick_masks:
+            write_tricks(w_file)
+        w_file.write(
+            "\n\n".join(
+                f'def set_{name}_rules(w: "WotWWorld", *args):\n'
+                f'    """Add the rules of `{module}.py`, importing it on the first call."""\n'
+                f'    import_module(".{module}", __package__).set_{name}_rules(w, *args)\n'
+                for name, module in zip(tier_names, tier_modules)
+            )
+        )
+        w_file.write("\n\n" + read_template("dispatcher"))
 
-    elif indent == 1:
-        req1, req2, req3, req4, req5 = "", "", "", "", ""
-        difficulty = 0  # Reset the difficulty to moki
-        if not anchor:  # Only happens with `requirement:` or `region`, ignore it
-            continue
-        if "nospawn" in line or "tprestriction" in line:
+
+def write_items(w_file: TextIO, lines: Iterable[str]) -> None:
+    """Write the lines of a table separated with commas, without a trailing comma."""
+    separator = ""
+    for line in lines:
+        w_file.write(separator)
+        w_file.write(line)
+        separator = ",\n"
+
+
+def write_refills(w_file: TextIO, logic: dict[str, Any], refill_rules: Optional[list[Rule]] = None) -> None:
+    """Write the content of `Refills.py`, with the rules of the refills as data if they are given."""
+    w_file.write(
+        "refills: dict[str, tuple[int, int, int]] = {  "
+        "# key: region name. Tuple: [health restored, energy restored, refill type]\n"
+        "    # For refill type: 0 is no refill, 1 is Checkpoint, 2 is Full refill.\n"
+    )
+    write_items(w_file, (f'    "{region}": {info}' for region, info in logic["refills"].items()))
+    if refill_rules is None:
+        w_file.write("\n    }\n\n" "refill_events: list[str] = [\n")
+        write_items(w_file, (f'    "{refill_name}"' for refill_name in logic["refill_events"]))
+        w_file.write("\n    ]\n")
+        return
+
+    table: dict[str, dict[str, list[tuple[int, tuple]]]] = {}
+    for rule in refill_rules:
+        table.setdefault(rule.anchor, {}).setdefault(rule.target[0], []).append((rule.tier, requirement_row(rule)))
+    w_file.write(
+        "\n    }\n\n"
+        "refill_events: list[str] = []  # The refills are not events, see `refill_rules`\n\n"
+        "# Requirements to use the refills from their region, per region and refill type (H: health, E: energy,\n"
+        "# C: checkpoint, F: full). Each entry holds the rule set (0: moki, ..., 6: unsafe glitched, as in\n"
+        "# `Rules.py`) and the requirements: skills (all needed), skills (one needed), other checks (0: door,\n"
+        "# 1: shop, 2: map, 3: ore, 4: danger, 5: glitch function), danger event, resources, or resources, moki.\n"
+        "refill_rules: dict[str, dict[str, list[tuple[int, tuple]]]] = {\n"
+    )
+    write_items(w_file, (f'    "{anchor}": {types}' for anchor, types in table.items()))
+    w_file.write("\n    }\n")
+
+
+def write_entrances(out_dir: str, logic: dict[str, Any], emitter: RuleEmitter) -> None:
+    """Write `Entrances.py`, without the entrances of the refills written as data and of the located locations."""
+    entrances = logic["entrances"]
+    if not emitter.options.refill_events:
+        refill_entrances = {f"{anchor} -> {kind}{anchor}" for anchor in logic["refills"] for kind in refill_prefixes}
+        entrances = [entrance for entrance in entrances if entrance not in refill_entrances]
+    anchor_locations: dict[str, list[str]] = {}
+    if emitter.placements is not None:
+        for name, anchors in emitter.placements.items():
+            if len(anchors) == 1:
+                anchor_locations.setdefault(anchors[0], []).append(name)
+        located = {f"{anchor} -> {name}" for anchor, names in anchor_locations.items() for name in names}
+        entrances = [entrance for entrance in entrances if entrance not in located]
+        print(
+            f"    Location rules: {len(located)} pickups, states and quests without their entrance "
+            f"({len(emitter.placements) - len(located)} with several anchors kept as entrances)."
+        )
+    with open(os.path.join(out_dir, "Entrances.py"), "w") as w_file:
+        w_file.write(header + "entrance_table: list[str] = [\n")
+        write_items(w_file, (f'    "{entrance}"' for entrance in entrances))
+        w_file.write("\n    ]\n")
+        if emitter.placements is not None:
+            w_file.write(
+                "\n\n# Pickups, states and quests with a single anchor: they are in the region of their anchor, and\n"
+                "# their access rule is added to the location (or event) in `Rules.py`. The others have an entrance.\n"
+                "anchor_locations: dict[str, list[str]] = {\n"
+            )
+            write_items(w_file, (f'    "{anchor}": {names}' for anchor, names in anchor_locations.items()))
+            w_file.write("\n    }\n")
+        print("The file `Entrances.py` has been successfully created.")
+
+
+def write_files(
+    logic: dict[str, Any],
+    out_dir: str = ".",
+    emitter: Optional[RuleEmitter] = None,
+    options: EmitOptions = EmitOptions(),
+) -> None:
+    """
+    Write the generated files from the parsed logic (as returned by `RulesParser.parse`), in the `out_dir` folder.
+
+    The rules are written from the emitter if they were streamed into it while parsing, else with the `options`.
+    """
+    if emitter is None:
+        emitter = RuleEmitter(options, logic["placements"])
+        for rule in logic["rules"]:
+            emitter.add(rule)
+    options = emitter.options
+    emitter.write(os.path.join(out_dir, "Rules.py"))
+    if options.split:
+        print(f"The files `Rules.py` and `{'.py`, `'.join(tier_modules)}.py` have been successfully created.")
+    else:
+        print("The file `Rules.py` has been successfully created.")
+    emitter.print_stats(logic["or_chains"])
+
+    write_entrances(out_dir, logic, emitter)
+    if emitter.item_index is not None:
+        emitter.item_index.write(out_dir)
+
+    with open(os.path.join(out_dir, "Refills.py"), "w") as w_file:
+        w_file.write(header)
+        write_refills(w_file, logic, None if options.refill_events else emitter.refill_rules)
+        print("The file `Refills.py` has been successfully created.")
+
+    with open(os.path.join(out_dir, "DoorData.py"), "w") as w_file:
+        w_file.write(header + "doors_vanilla: list[tuple[str, str]] = [  # Vanilla door connections\n")
+        write_items(w_file, (f"    {door}" for door in logic["doors_vanilla"]))
+        w_file.write("\n    ]\n\n\n" "doors_map: dict[str, int] = {  # Mapping to door ID\n")
+        write_items(w_file, (f'    "{door}": {value}' for door, value in logic["doors_map"].items()))
+        w_file.write("\n    }\n")
+        print("The file `DoorData.py` has been successfully created.")
+
+    if options.combat_data is not None:
+        write_combat_costs(out_dir, emitter.enemies, options.combat_data)
+
+
+def read_macros(lines: Iterable[Line]) -> dict[str, list[tuple[int, str]]]:
+    """
+    Return the requirements of each macro (i.e. `requirement` block) of the line records.
+
+    Each requirement is given with its difficulty, and the requirements of the enclosing lines are included.
+    """
+    macros: dict[str, list[tuple[int, str]]] = {}
+    name = ""
+    difficulty = 0
+    stack: list[str] = []  # Requirements of the enclosing lines
+    for _, indent, text in lines:
+        if indent == 0:
+            token = lex(text)
+            name = token.name if token.kind == "requirement" else ""
+            if name:
+                macros[name] = []
             continue
-        if line == "door:":
-            path_type = "conn"
-            is_door = True
+        if not name:
             continue
-        is_door = False
-
-        if is_region:
-            try:  # Copied from indent 2, by applying it to req1 instead
-                path_diff = try_group(r_difficulty, line, end=-1)  # moki, gorlek, kii, unsafe
-                difficulty = convert_diff[path_diff]
-                req1 = line[try_end(r_difficulty, line) + 1 :]  # Can be empty
-            except RuntimeError as e:
-                print(f"Failed to find the difficulty in line {i}.\nReason: {e}")
-                difficulty = convert_diff["moki"]
-                req1 = line  # Can be empty
-            if req1:
-                if req1[-1] == ":":
-                    req1 = req1[:-1]
-                else:
-                    should_convert = True
+        if indent == 1:
+            token = lex(text)
+            difficulty = convert_diff[token.name] if token.kind == "difficulty" else 0
+            value, block = token.value, token.block
         else:
-            path_type = try_group(r_type, line, end=-1)  # Connection type
-            if path_type not in ("conn", "state", "pickup", "refill", "quest"):
-                raise ValueError(f'{path_type} (line {i}) is not an appropriate path type.\n"{line}"')
-            if path_type == "refill":
-                if ":" in line:
-                    path_name = try_group(r_name, line, 1, -1)  # Checkpoint, Full, Energy=x...
-                    conv_refill()
-                else:
-                    path_name = try_group(r_refill, line, 1)  # Checkpoint, Full, Energy=x...
-                    conv_refill()
-                    should_convert = True
-                    req1 = "free"
-            else:
-                path_name = try_group(r_name, line, 1, -1)  # Name
+            value, block = (text[:-1], True) if text[-1] == ":" else (text, False)
+        stack = stack[: indent - 1] + [value]
+        if not block:
+            macros[name].append((difficulty, ", ".join(req for req in stack if req).replace(":", ",")))
+    return macros
 
-            if "free" in line:
-                should_convert = True
-                req1 = "free"
 
-    elif indent == 2:  # When not a door, this contains the path difficulty
-        req2, req3, req4, req5 = "", "", "", ""
-        if not anchor:  # Only happens with `requirement:` or `region`, ignore it
-            continue
-        if is_door:
-            if "id:" in line:
-                door_id = int(line[4:])
-            elif "target:" in line:
-                path_name = line[8:]
-                path_type = "conn"
-                doors_vanilla.append((anchor + " (Door)", path_name + " (Door)"))
-                doors_map.setdefault(anchor + " (Door)", door_id)
-                create_door_rules()
-                # To connect the anchor to the door, the rest is done in create_door_rules
-                path_name = anchor + " (Door)"
-            elif "free" in line:  # Case of a free door connection
-                should_convert = True
-                req1 = "free"
-                req2 = ""
-            else:  # Case of line == "enter:", the rules are in the next lines
-                is_enter = True
+# %% Parser
+
+
+class RulesParser:
+    """
+    Parser converting the tokenized `areas.wotw` file into the logic model (see `logic.py`).
+
+    Each parser holds its own state, so several inputs can be parsed in the same process.
+    Use `parse` to parse the line records, then `emit` to write the generated files.
+    If an emitter is given, the rules are rendered into it as soon as they are parsed.
+    If the macros are given (as returned by `read_macros`), they are expanded in the requirements that use them,
+    instead of being used as events.
+    Without `keep_rules`, the rules are only streamed to the emitter and the parsed logic has no rules, so the memory
+    used by the rules does not grow with the file.
+    """
+
+    def __init__(
+        self,
+        emitter: Optional[RuleEmitter] = None,
+        macros: Optional[dict[str, list[tuple[int, str]]]] = None,
+        keep_rules: bool = True,
+    ) -> None:
+        if emitter is None and not keep_rules:
+            raise ValueError("The rules must be kept when they are not streamed to an emitter.")
+        self.emitter = emitter
+        self.keep_rules = keep_rules
+        self.macros = macros or {}
+        self.expanded_macros: dict[str, list[tuple[int, str]]] = {}  # Memoized expansions of the macros
+        self.logic: dict[str, Any] = new_logic()  # Parsed logic
+        # Shortcuts to the content of the parsed logic
+        self.rules: list[Rule] = self.logic["rules"]
+        self.entrances: list[str] = self.logic["entrances"]
+        self.refills: dict[str, tuple[int, int, int]] = self.logic["refills"]
+        self.refill_events: list[str] = self.logic["refill_events"]
+        self.doors_map: dict[str, int] = self.logic["doors_map"]
+        self.doors_vanilla: list[tuple[str, str]] = self.logic["doors_vanilla"]
+        self.or_chains: Counter = self.logic["or_chains"]
+        self.placements: dict[str, list[str]] = self.logic["placements"]
+
+        # State of the parser
+        self.anchor = ""  # Name of the current anchor
+        self.difficulty = 0  # Difficulty of the path
+        self.req = ""  # Full requirement
+        self.refill_type = ""  # Refill type (energy, health, checkpoint or full)
+        self.path_type = ""  # Type of the path (connection, pickup, refill)
+        self.path_name = ""  # Name of the location/region/event accessed by the path
+        self.target_area = ""  # Area of the path_name anchor
+
+        # Requirements of the current clause
+        self.and_req: list[str] = []  # Stores the requirements form an and chain (i.e. coma separated requirements)
+        self.and_glitches: list[str] = []  # Glitches used by the current path
+        self.and_skills: list[str] = []  # Store the skills, events from the and chain
+        self.and_other: list[str] = []  # Store the requirements that have their own fonction (glitches, keys...)
+        self.and_resource: list[tuple[str, Any]] = []  # Store the requirements that involve resources (and chain)
+        self.or_req: list[list[str]] = []  # Stores the requirements from each OR chain
+        self.or_skills: list[str] = []
+        self.or_resource: list[tuple[str, Any]] = []
+        self.or_glitch: list[str] = []
+
+    def parse(self, lines: Iterable[Line]) -> dict[str, Any]:
+        """Parse the line records (as returned by `tokenizer.read_areas`) and return the parsed logic."""
+        indent = 0  # Number of indents
+        req1 = ""  # Requirements from first indent
+        req2 = ""  # Requirements from second indent
+        req3 = ""  # Requirements from third indent
+        req4 = ""  # Requirements from fourth indent
+        req5 = ""  # Requirements from fifth indent
+        is_door = False  # True while parsing a door
+        is_enter = False  # True when in an enter clause (when parsing the door rules)
+        door_id = 0
+        is_region = False  # True when parsing a region requirement
+        token = None
+
+        for i, indent, line in lines:  # Line number is only used for debug
+            should_convert = False  # If True, convert is called to create a rule
+            # When parsing a door connection, there is one extra indent, it is easier to remove it there
+            if is_enter:
+                if indent < 3:  # Exited from enter clause, so set it to false
+                    is_enter = False
+                else:  # Remove the extra indent to avoid adding new cases
+                    indent -= 1
+
+            if indent <= 2:  # Deeper lines are always requirement lines
+                token = lex(line)
+
+            if indent == 0:  # Always anchor, except for requirement or region (which are ignored)
+                req1, req2, req3, req4, req5 = "", "", "", "", ""
+                is_region = False
+                if token.kind == "anchor":
+                    self.anchor = token.name
+                    self.refills.setdefault(self.anchor, (0, 0, 0))
+                elif token.kind == "region":
+                    self.anchor = "Menu"
+                    self.path_name = f"danger_{token.name}"
+                    self.path_type = "conn"
+                    is_region = True
+
+                else:
+                    self.anchor = ""
+
+            elif indent == 1:
+                req1, req2, req3, req4, req5 = "", "", "", "", ""
+                self.difficulty = 0  # Reset the difficulty to moki
+                if not self.anchor:  # Only happens with `requirement:` or `region`, ignore it
+                    continue
+                if token.kind in ("nospawn", "tprestriction"):
+                    continue
+                if token.kind == "door":
+                    self.path_type = "conn"
+                    is_door = True
+                    continue
                 is_door = False
 
-        elif is_region:  # Copied from indent 3, by applying it to req2 instead
-            if line[-1] == ":":
-                req2 = line[:-1]
-            else:
-                req2 = line
-                should_convert = True
+                if is_region:  # Copied from indent 2, by applying it to req1 instead
+                    if token.kind == "difficulty":
+                        self.difficulty = convert_diff[token.name]  # moki, gorlek, kii, unsafe
+                    else:
+                        print(f'Failed to find the difficulty in line {i}, moki is used instead.\n"{line}"')
+                        self.difficulty = convert_diff["moki"]
+                    req1 = token.value  # Can be empty
+                    if req1 and not token.block:
+                        should_convert = True
+                else:
+                    self.path_type = token.kind  # Connection type
+                    if self.path_type not in ("conn", "state", "pickup", "refill", "quest"):
+                        raise ValueError(f'{self.path_type} (line {i}) is not an appropriate path type.\n"{line}"')
+                    self.path_name = token.name  # Name, or Checkpoint, Full, Energy=x... for the refills
+                    if self.path_type == "refill":
+                        self.conv_refill()
+
+                    if token.value == "free" or (self.path_type == "refill" and not token.value and not token.block):
+                        should_convert = True  # Case of a free path, or a refill without colon (i.e. `refill Full`)
+                        req1 = "free"
+
+            elif indent == 2:  # When not a door, this contains the path difficulty
+                req2, req3, req4, req5 = "", "", "", ""
+                if not self.anchor:  # Only happens with `requirement:` or `region`, ignore it
+                    continue
+                if is_door:
+                    if token.kind == "id":
+                        door_id = int(token.value)
+                    elif token.kind == "target":
+                        self.path_name = token.value
+                        self.path_type = "conn"
+                        self.doors_vanilla.append((self.anchor + " (Door)", self.path_name + " (Door)"))
+                        self.doors_map.setdefault(self.anchor + " (Door)", door_id)
+                        self.create_door_rules()
+                        # To connect the anchor to the door, the rest is done in create_door_rules
+                        self.path_name = self.anchor + " (Door)"
+                    elif token.value == "free":  # Case of a free door connection
+                        should_convert = True
+                        req1 = "free"
+                        req2 = ""
+                    else:  # Case of line == "enter:", the rules are in the next lines
+                        is_enter = True
+                        is_door = False
+
+                elif is_region:  # Copied from indent 3, by applying it to req2 instead
+                    if line[-1] == ":":
+                        req2 = line[:-1]
+                    else:
+                        req2 = line
+                        should_convert = True
 
-        else:
-            try:
-                path_diff = try_group(r_difficulty, line, end=-1)  # moki, gorlek, kii, unsafe
-                difficulty = convert_diff[path_diff]
-                req2 = line[try_end(r_difficulty, line) + 1 :]  # Can be empty
-            except RuntimeError as e:
-                print(f"Failed to find the difficulty in line {i}.\nReason: {e}")
-                difficulty = convert_diff["moki"]
-                req2 = line  # Can be empty
-            if req2:
-                if req2[-1] == ":":
-                    req2 = req2[:-1]
                 else:
+                    if token.kind == "difficulty":
+                        self.difficulty = convert_diff[token.name]  # moki, gorlek, kii, unsafe
+                    else:
+                        print(f'Failed to find the difficulty in line {i}, moki is used instead.\n"{line}"')
+                        self.difficulty = convert_diff["moki"]
+                    req2 = token.value  # Can be empty
+                    if req2 and not token.block:
+                        should_convert = True
+
+            elif indent == 3:
+                req3, req4, req5 = "", "", ""
+                if not self.anchor:  # Only happens with `requirement:` or `region`, ignore it
+                    continue
+                if line[-1] == ":":
+                    req3 = line[:-1]
+                else:
+                    req3 = line
                     should_convert = True
 
-    elif indent == 3:
-        req3, req4, req5 = "", "", ""
-        if not anchor:  # Only happens with `requirement:` or `region`, ignore it
-            continue
-        if line[-1] == ":":
-            req3 = line[:-1]
+            elif indent == 4:
+                req4, req5 = "", ""
+                if not self.anchor:  # Only happens with `requirement:` or `region`, ignore it
+                    continue
+                if line[-1] == ":":
+                    req4 = line[:-1]
+                else:
+                    req4 = line
+                    should_convert = True
+
+            elif indent == 5:
+                req5 = ""
+                if not self.anchor:  # Only happens with `requirement:` or `region`, ignore it
+                    continue
+                req5 = line
+                should_convert = True
+
+            else:
+                raise NotImplementedError(f"Too many indents ({indent}) on line {i}.\n{line}")
+
+            if should_convert:
+                self.req = req1
+                if indent >= 2:
+                    if self.req and req2:  # req1 can be empty, same for req2
+                        self.req += f", {req2}"
+                    elif req2:  # Case where req1 empty, req2 non empty
+                        self.req = req2
+                if indent >= 3:
+                    if self.req:
+                        self.req += f", {req3}"
+                    else:
+                        self.req = req3
+                if indent >= 4:
+                    self.req += f", {req4}"
+                if indent >= 5:
+                    self.req += f", {req5}"
+                # In some cases, a colon is used in place of a coma, regroup the two cases
+                self.req = self.req.replace(":", ",")
+                self.convert()
+
+        return self.logic
+
+    def emit(self, out_dir: str = ".") -> None:
+        """Write the generated files from the parsed logic, in the `out_dir` folder (the emitter is only used once)."""
+        write_files(self.logic, out_dir, self.emitter)
+        self.emitter = None
+
+    def add_rule(self, rule: Rule) -> None:
+        """Store the rule (if `keep_rules`), and stream it to the emitter if there is one."""
+        if self.keep_rules:
+            self.rules.append(rule)
+        if self.emitter is not None:
+            self.emitter.add(rule)
+
+    def conv_refill(self) -> None:
+        """Get the refill type (to add before the region name) and update the data tables."""
+        current = self.refills[self.anchor]
+        if "=" in self.path_name:
+            value = int(self.path_name[-1])
+            if self.path_name[:-2] == "Health":
+                if current[0] == 0:
+                    self.refills.update({self.anchor: (value, current[1], current[2])})
+                    self.refill_events.append(f"H.{self.anchor}")
+                self.refill_type = "H."
+            if self.path_name[:-2] == "Energy":
+                if current[1] == 0:
+                    self.refills.update({self.anchor: (current[0], value, current[2])})
+                    self.refill_events.append(f"E.{self.anchor}")
+                self.refill_type = "E."
+        elif self.path_name == "Checkpoint":
+            self.refills.update({self.anchor: (current[0], current[1], 1)})
+            self.refill_events.append(f"C.{self.anchor}")
+            self.refill_type = "C."
+        elif self.path_name == "Full":
+            self.refills.update({self.anchor: (current[0], current[1], 2)})
+            self.refill_events.append(f"F.{self.anchor}")
+            self.refill_type = "F."
         else:
-            req3 = line
-            should_convert = True
+            raise ValueError(f"{self.path_name} is not a valid refill type (at anchor {self.anchor}).")
+
+    def convert(self) -> None:
+        """Convert the data from req into lists, and make the calls to append_rules according to the lists' content."""
+        self.target_area = ""
+
+        # Get the requirements when entering a new area.
+        if self.path_type == "conn" and "." in self.path_name:
+            dot_position = self.path_name.find(".")
+            f_area = self.path_name[:dot_position]  # Extract the name of the target area
+            if "." in self.anchor:
+                dot_position = self.anchor.find(".")
+                i_area = self.anchor[:dot_position]  # Extract the name of the starting area
+            else:
+                i_area = ""
+
+            # Apply the region requirements if the regions differ, or if exiting a door (in case door rando is used).
+            # Skip it for some regions as they don't have any danger requirement.
+            if i_area != f_area and f_area not in regions_free:
+                self.target_area = f_area
+
+        if self.path_type == "refill":
+            self.path_name = self.refill_type + self.anchor
+
+        conn_name = f"{self.anchor} -> {self.path_name}"
+        if conn_name not in self.entrances:
+            self.entrances.append(conn_name)
+            if self.path_type in ("pickup", "state", "quest"):
+                self.placements.setdefault(self.path_name, []).append(self.anchor)
+
+        if not self.macros:
+            self.convert_req()
+            return
+        # The macros can be harder than the path: the expanded requirements use the hardest difficulty of the two
+        req, difficulty = self.req, self.difficulty
+        for macro_difficulty, self.req in self.expand_macros(req):
+            self.difficulty = max(difficulty, macro_difficulty)
+            self.convert_req()
+        self.req, self.difficulty = req, difficulty
+
+    def expand_macros(self, req: str) -> list[tuple[int, str]]:
+        """
+        Return the requirements that replace the requirement with its macros expanded, with their minimal difficulty.
+
+        A macro in an `or` chain is taken out of the chain, as a requirement of its own.
+        """
+        parts = req.split(", ")
+        for index, part in enumerate(parts):
+            options = part.split(" OR ")
+            used = [option for option in options if option in self.macros]
+            if not used:
+                continue
+            rest = parts[:index] + parts[index + 1 :]
+            others = [option for option in options if option not in self.macros]
+            expanded: list[tuple[int, str]] = []
+            if others:  # Case where the chain is fulfilled without the macros
+                expanded += self.expand_macros(", ".join(rest + [" OR ".join(others)]))
+            for macro in used:
+                for macro_difficulty, macro_req in self.expand_macro(macro):
+                    for difficulty, new_req in self.expand_macros(", ".join(rest + [macro_req])):
+                        expanded.append((max(difficulty, macro_difficulty), new_req))
+            return expanded
+        return [(0, req)]
+
+    def expand_macro(self, name: str) -> list[tuple[int, str]]:
+        """Return the requirements of the macro, with the macros that it uses expanded (memoized)."""
+        if name not in self.expanded_macros:
+            self.expanded_macros[name] = []  # Guard against the recursive macros
+            self.expanded_macros[name] = [
+                (max(difficulty, req_difficulty), expanded)
+                for difficulty, req in self.macros[name]
+                for req_difficulty, expanded in self.expand_macros(req)
+            ]
+        return self.expanded_macros[name]
+
+    def convert_req(self) -> None:
+        """Split the requirement into the `and` and `or` chains, and make the calls to append_rule."""
+        # Reset the values
+        self.and_req = []
+        self.or_req = []
+        self.or_skills = []
+        self.or_resource = []
+        self.or_glitch = []
+        self.and_resource = []
+        self.and_skills = []
+        self.and_other = []
+
+        s_req = self.req.split(", ")
+        for elem in s_req:
+            if " OR " in elem:
+                self.or_req.append(elem.split(" OR "))
+            else:
+                self.and_req.append(elem)
+
+        if len(self.or_req) == 0:
+            self.parse_and()
+            self.append_rule()
+
+        elif len(self.or_req) == 1:  # One `or` chain in the requirements
+            self.order_or(self.or_req[0])
+            self.handle_or_chain()
+
+        else:  # Several `or` chains
+            self.expand_or_chains()
+
+    def handle_or_chain(self) -> None:
+        """Split the requirements from the or_chain and make the calls to append_rule."""
+        temp_glitch = self.or_glitch.copy()  # Make a copy, so it is safe to empty the list in this scope
+        while temp_glitch:  # If glitches are present, add them one at a time to the and chain
+            self.and_req.append(temp_glitch[-1])
+            temp_glitch.pop()
+            self.parse_and()
+            self.append_rule(use_or_resource=False)  # The glitch replaces the rest of the chain
+            self.and_req.pop()  # Remove the requirement added above
+        if self.or_skills:
+            self.parse_and()
+            self.append_rule(use_or_skills=True, use_or_resource=False)
+        if self.or_resource:
+            self.parse_and()
+            self.append_rule()
+
+    def or_chain_clauses(self) -> int:
+        """Return the number of clauses that `handle_or_chain` makes for the chain parsed by `order_or`."""
+        return len(self.or_glitch) + bool(self.or_skills) + bool(self.or_resource)
+
+    def factor_or_chains(self) -> list[list[str]]:
+        """
+        Return the `or` chains that are not always fulfilled given the `and` chain and the other `or` chains.
+
+        A chain is removed if it contains a requirement of the `and` chain (or `free`), or all the requirements of
+        another chain. Only the requirements without a cost are factored (see `is_resource`): the resources are paid
+        once per chain. The duplicate requirements of a chain are also removed.
+        """
+        chains = [list(dict.fromkeys(chain)) for chain in self.or_req]
+        and_req = {req for req in self.and_req if not is_resource(req)} | {"free"}
+        chains = [chain for chain in chains if and_req.isdisjoint(chain)]
+        factored: list[list[str]] = []
+        for i, chain in enumerate(chains):
+            # Keep the first of the identical chains, and the chains that do not contain another chain
+            if not any(
+                set(other).issubset(chain)
+                and (len(other) < len(set(chain)) or j < i)
+                and not any(is_resource(req) for req in other)
+                for j, other in enumerate(chains)
+                if j != i
+            ):
+                factored.append(chain)
+        return factored
+
+    def expand_or_chains(self) -> None:
+        """
+        Make the calls to append_rule for a requirement with several `or` chains, by distributing the chains.
+
+        Each chain is split as in `handle_or_chain`: one alternative per glitch, one for the skills (one of them is
+        needed) and one for the resources (one of them is needed). A clause takes one alternative of each chain, and
+        holds at most one group of skills and one group of resources: the smaller groups are split into single
+        requirements. A requirement making more than `max_or_clauses` clauses raises a ValueError.
+        """
+        legacy_clauses = 0  # Number of clauses made by the former splitting (at most two chains)
+        if len(self.or_req) == 2:
+            first, second = sorted(self.or_req, key=len)
+            self.order_or(second)
+            legacy_clauses = len(first) * self.or_chain_clauses()
+
+        chains = self.factor_or_chains()
+        if len(chains) <= 1:
+            if chains:
+                self.order_or(chains[0])
+                clauses = self.or_chain_clauses()
+                self.handle_or_chain()
+            else:
+                clauses = 1
+                self.parse_and()
+                self.append_rule()
+            self.or_chains.update(lines=1, legacy=legacy_clauses, clauses=clauses, factored=1)
+            return
+
+        alternatives: list[list[tuple[str, Any]]] = []  # Alternatives of each chain
+        for chain in chains:
+            self.order_or(chain)
+            options: list[tuple[str, Any]] = [("req", glitch) for glitch in self.or_glitch]
+            if self.or_skills:
+                options.append(("skills", self.or_skills))
+            if self.or_resource:
+                options.append(("resources", self.or_resource))
+            alternatives.append(options)
+
+        clauses = 0
+        and_req = self.and_req
+        for combination in itertools.product(*alternatives):
+            self.and_req = and_req + [value for kind, value in combination if kind == "req"]
+            skill_groups = sorted((value for kind, value in combination if kind == "skills"), key=len)
+            resource_groups = sorted((value for kind, value in combination if kind == "resources"), key=len)
+            or_skills = skill_groups.pop() if skill_groups else []  # Keep the largest groups
+            or_resource = resource_groups.pop() if resource_groups else []
+            for skills, resources in itertools.product(
+                itertools.product(*skill_groups), itertools.product(*resource_groups)
+            ):
+                if clauses == max_or_clauses:
+                    raise ValueError(
+                        f"Too many clauses for {self.anchor} -> {self.path_name}: more than {max_or_clauses}."
+                    )
+                self.parse_and()
+                self.and_skills += [skill for skill in skills if skill not in self.and_skills]
+                self.and_resource += resources
+                self.or_skills = or_skills
+                self.or_resource = or_resource
+                self.append_rule(use_or_skills=True)
+                clauses += 1
+        self.and_req = and_req
+        self.or_chains.update(lines=1, legacy=legacy_clauses, clauses=clauses)
+
+    def parse_and(self) -> None:
+        """Parse the list of requirements in the `and` chain, and put the processed information in the and lists."""
+        # Reset the values
+        self.and_glitches = []
+        self.and_skills = []  # Stores inf_skills
+        self.and_resource = []
+        self.and_other = []
+
+        for requirement in self.and_req:
+            if "=" in requirement:
+                elem, value = requirement.split("=")  # elem: type of path ; value: value associated
+            else:
+                if requirement in name_convert.keys():
+                    requirement = name_convert[requirement]
+                elem = requirement
+                value = "1"
+
+            # Handle the glitches
+            if elem in other_glitches.keys():  # Glitches that use a function
+                self.and_glitches.append(elem)
+                self.and_other.append(elem)
+            elif elem in inf_glitches.keys():  # Glitches that can be used infinitely and only use one skill
+                self.and_glitches.append(elem)
+                current_req = inf_glitches[elem]
+                if current_req not in self.and_skills and current_req != "free":
+                    self.and_skills.append(current_req)
+            elif elem in energy_glitches.keys():
+                self.and_glitches.append(elem)
+                self.and_resource.append(("energy", (energy_glitches[elem], int(value))))
+            elif elem in wall_glitches.keys():
+                self.and_glitches.append(elem)
+                self.and_resource.append(("wall", (wall_glitches[elem], int(value))))
+
+            # Check on requirement and not on elem to catch the energy skills without the =
+            elif requirement in inf_skills:
+                if requirement not in self.and_skills and requirement != "free":
+                    self.and_skills.append(requirement)
+            elif elem in en_skills:
+                self.and_resource.append(("energy", (elem, int(value))))
+            elif elem == "Damage":
+                self.and_resource.append(("db", int(value)))
+            elif elem in ("BreakWall", "Boss"):
+                self.and_resource.append(("wall", (elem, int(value))))
+            elif (
+                "Keystone=" in requirement
+                or "Ore=" in requirement
+                or "SpiritLight=" in requirement
+                or "Danger=" in requirement
+            ):  # Case of a keystone door, or spirit light, or ore, or danger value
+                self.and_other.append(requirement)
+            elif elem == "Combat":
+                self.and_resource += parse_combat(value)
+            else:  # Case of an event
+                self.and_skills.append(elem)
+
+    def order_or(self, or_chain: list[str]) -> None:
+        """Parse the list of requirements in the `or` chain, and categorize them between skills and resources."""
+        self.or_skills = []  # Store inf_skills (skills that don't require energy to use)
+        self.or_glitch = []  # Store the glitches
+        self.or_resource = []  # Store requirements that need resources
+
+        for requirement in or_chain:
+            if "=" in requirement:
+                elem, value = requirement.split("=")  # elem: type of path ; value: value associated
+            else:
+                if requirement in name_convert.keys():
+                    requirement = name_convert[requirement]
+                elem = requirement
+                value = 0
+
+            # Find the glitches (not parsed here)
+            if (
+                elem in other_glitches.keys()
+                or elem in inf_glitches.keys()
+                or elem in energy_glitches.keys()
+                or elem in wall_glitches.keys()
+            ):
+                self.or_glitch.append(requirement)
+
+            # Check on requirement and not on elem to catch the energy skills without the =
+            elif requirement in inf_skills:
+                if requirement not in self.and_skills and requirement != "free":
+                    self.or_skills.append(requirement)
+            elif elem in en_skills:
+                self.or_resource.append(("energy", (elem, int(value))))
+            elif elem == "Damage":
+                self.or_resource.append(("db", int(value)))
+            elif elem in ("BreakWall", "Boss"):
+                self.or_resource.append(("wall", (elem, int(value))))
+            elif elem == "Combat":
+                self.or_resource += parse_combat(value)
+            else:  # Case of an event
+                self.or_skills.append(elem)
+            # Keystone, Ore and Spirit Light never appear in an `or` chain
+
+    def append_rule(self, use_or_skills: bool = False, use_or_resource: bool = True) -> None:
+        """
+        Add the current clause to the rules list.
+
+        When use_or_skills is set to False, the skills from the or chain are not used.
+        When use_or_resource is set to False, only the resources from the and chain are used.
+        This happens when looping through or_glitch or using the or_skills.
+        """
+        used_or_skills = self.or_skills if use_or_skills else []
+        used_or_res = self.or_resource if use_or_resource else []
+
+        self.add_rule(
+            Rule(
+                self.anchor,
+                self.path_name,
+                self.difficulty,
+                tuple(self.and_glitches),
+                tuple(self.and_skills),
+                tuple(used_or_skills),
+                tuple(self.and_other),
+                self.target_area,
+                tuple(self.and_resource),
+                tuple(used_or_res),
+            )
+        )
 
-    elif indent == 4:
-        req4, req5 = "", ""
-        if not anchor:  # Only happens with `requirement:` or `region`, ignore it
-            continue
-        if line[-1] == ":":
-            req4 = line[:-1]
+    def create_door_rules(self) -> None:
+        """Add to the rules and the entrances some connection rules for the doors."""
+        dot_position = self.anchor.find(".")
+        area = self.anchor[:dot_position]  # Extract the name of the area
+        # Link the door to the anchor (the connection from anchor to door can have a rule and is done in append_rule)
+        # Also check for the region requirements when exiting a door
+        if area in regions_free:
+            danger = ""
         else:
-            req4 = line
-            should_convert = True
+            danger = area
+        self.add_rule(Rule(f"{self.anchor} (Door)", self.anchor, 0, (), (), (), (), danger, (), ()))
+        self.entrances.append(f"{self.anchor} (Door) -> {self.anchor}")
 
-    elif indent == 5:
-        req5 = ""
-        if not anchor:  # Only happens with `requirement:` or `region`, ignore it
+
+# %% Parallel parsing
+
+
+def split_chunks(lines: tuple[Line, ...], count: int) -> list[tuple[Line, ...]]:
+    """
+    Split the line records into at most `count` chunks of similar size, that can be parsed independently.
+
+    The chunks are only cut before a block (starting at indent 0) that does not depend on the state left by the previous
+    one, i.e. a region, or an anchor whose first path is defined on its first indented line.
+    """
+    starts: list[int] = []  # Positions where a chunk can start
+    for index, (_, indent, text) in enumerate(lines):
+        if indent != 0 or index + 1 == len(lines):
             continue
-        req5 = line
-        should_convert = True
+        kind = lex(text).kind
+        next_line = lines[index + 1]
+        if kind == "region" or (
+            kind == "anchor"
+            and next_line.indent == 1
+            and lex(next_line.text).kind in ("conn", "state", "pickup", "quest", "refill", "door")
+        ):
+            starts.append(index)
+
+    chunks: list[tuple[Line, ...]] = []
+    size = len(lines) / max(count, 1)  # Target size of the chunks
+    begin = 0
+    for start in starts:
+        if start - begin >= size:
+            chunks.append(lines[begin:start])
+            begin = start
+    chunks.append(lines[begin:])
+    return chunks
+
+
+def _parse_chunk(lines: tuple[Line, ...], macros: Optional[dict[str, list[tuple[int, str]]]]) -> dict[str, Any]:
+    """Parse a chunk of the line records in a new parser (used by the worker processes)."""
+    return RulesParser(macros=macros).parse(lines)
+
+
+def merge_logic(parts: list[dict[str, Any]]) -> dict[str, Any]:
+    """Merge the logic parsed from consecutive chunks, in the same way as if it was parsed at once."""
+    logic = new_logic()
+    seen_entrances: set[str] = set()
+    for part in parts:
+        logic["rules"] += part["rules"]
+        for entrance in part["entrances"]:
+            # The door entrances (`X (Door) -> X`) are always added, the others only once
+            if entrance not in seen_entrances or entrance.split(" -> ")[0].endswith(" (Door)"):
+                logic["entrances"].append(entrance)
+                seen_entrances.add(entrance)
+        logic["refills"].update(part["refills"])
+        logic["refill_events"] += part["refill_events"]
+        for door, door_id in part["doors_map"].items():
+            logic["doors_map"].setdefault(door, door_id)
+        logic["doors_vanilla"] += part["doors_vanilla"]
+        logic["or_chains"].update(part["or_chains"])
+        for name, anchors in part["placements"].items():
+            placement = logic["placements"].setdefault(name, [])
+            placement += [anchor for anchor in anchors if anchor not in placement]
+    return logic
+
+
+def parse_parallel(
+    lines: tuple[Line, ...], workers: Optional[int] = None, inline_macros: bool = False
+) -> dict[str, Any]:
+    """
+    Parse the line records with a pool of `workers` processes (by default, one per CPU), and return the parsed logic.
 
+    The result is the same as with `RulesParser().parse(lines)`. If an anchor is defined several times, its refills
+    depend on the previous definitions, so the parsing is done in this process instead.
+    With `inline_macros`, the macros are read beforehand and given to every parser (see `RulesParser`).
+    """
+    macros = read_macros(lines) if inline_macros else None
+    anchors = [lex(text).name for _, indent, text in lines if indent == 0 and text.startswith("anchor ")]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or len(anchors) != len(set(anchors)):
+        return RulesParser(macros=macros).parse(lines)
+
+    chunks = split_chunks(lines, workers * 4)  # More chunks than workers, to balance the load
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        parts = list(executor.map(_parse_chunk, chunks, itertools.repeat(macros, len(chunks))))
+    return merge_logic(parts)
+
+
+# %% Main script
+
+
+def logic_key() -> str:
+    """Return the key of the parsed logic in the cache."""
+    return cache.cache_key(("./areas.wotw", "./loc_data.csv"), parser_version)
+
+
+def load_logic(use_cache: bool = True, workers: int = 1, inline_macros: bool = False) -> dict[str, Any]:
+    """
+    Return the logic parsed from the `areas.wotw` file.
+
+    The parsed logic is cached (see `cache.py`), so the parsing is skipped if the source files did not change.
+    Without `use_cache`, the cache is neither read nor written.
+    With `workers` greater than 1, the file is parsed by that many processes (see `parse_parallel`).
+    With `inline_macros`, the macros are expanded in the requirements instead of being used as events.
+    """
+    cache_name = "rules_macros" if inline_macros else "rules"
+    logic = cache.load(cache_name, logic_key()) if use_cache else None
+    if logic is None:
+        logic = parse_parallel(read_areas(), workers, inline_macros)
+        if use_cache:
+            cache.store(cache_name, logic_key(), logic)
+    return logic
+
+
+def parse_rules(
+    out_dir: str = ".",
+    use_cache: bool = True,
+    workers: int = 1,
+    tables: bool = False,
+    inline_macros: bool = False,
+    options: EmitOptions = EmitOptions(),
+) -> None:
+    """
+    Extract the rules from the `areas.wotw` file and write the generated files in the `out_dir` folder.
+
+    See `load_logic` for the cache, `workers` and `inline_macros`, and `EmitOptions` for the generated rules. When the
+    file is parsed in this process, the rules are rendered while parsing (and not kept in memory without `use_cache`).
+    With `tables`, the rules are also written as requirement tables (see `rule_tables.py`). Use the same
+    `inline_macros` as for `extract_data.extract_all`.
+    """
+    cache_name = "rules_macros" if inline_macros else "rules"
+    logic = cache.load(cache_name, logic_key()) if use_cache else None
+    if logic is None and workers <= 1 and not options.location_rules:  # The location rules need all the anchors
+        lines = read_areas()
+        parser = RulesParser(RuleEmitter(options), read_macros(lines) if inline_macros else None, use_cache or tables)
+        logic = parser.parse(lines)
+        if use_cache:
+            cache.store(cache_name, logic_key(), logic)
+        parser.emit(out_dir)
     else:
-        raise NotImplementedError(f"Too many indents ({indent}) on line {i}.\n{line}")
-
-    if should_convert:
-        req = req1
-        if indent >= 2:
-            if req and req2:  # req1 can be empty, same for req2
-                req += f", {req2}"
-            elif req2:  # Case where req1 empty, req2 non empty
-                req = req2
-        if indent >= 3:
-            if req:
-                req += f", {req3}"
-            else:
-                req = req3
-        if indent >= 4:
-            req += f", {req4}"
-        if indent >= 5:
-            req += f", {req5}"
-        req = req.replace(":", ",")  # In some cases, a colon is used in place of a coma, regroup the two cases
-        convert()
+        if logic is None:
+            logic = load_logic(False, workers, inline_macros)
+        write_files(logic, out_dir, options=options)
+    if tables:
+        from rule_tables import write_tables  # Imported here, as `rule_tables` imports this module
+
+        write_tables(logic, out_dir)
 
-write_files()
 
-# Convert the parsed line into lists of requirements
+if __name__ == "__main__":
+    parse_rules()
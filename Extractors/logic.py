@@ -0,0 +1,49 @@
+"""
+Data model of the logic parsed from the `areas.wotw` file.
+
+The parser in `extract_rules.py` produces this model, and the emission code writes the generated files from it.
+"""
+
+from collections import Counter
+from typing import Any, NamedTuple
+
+
+class Rule(NamedTuple):
+    """A requirement clause giving access to an entrance (i.e. a connection, a pickup, an event...)."""
+
+    anchor: str  # Name of the starting region
+    target: str  # Name of the connected region, location or event
+    difficulty: int  # Difficulty of the path (0: moki, 1: gorlek, 3: kii, 5: unsafe)
+    glitches: tuple[str, ...]  # Glitches used in the clause
+    skills: tuple[str, ...]  # Skills and events that are all needed
+    any_skills: tuple[str, ...]  # Skills and events of which only one is needed
+    other: tuple[str, ...]  # Requirements that have their own function (some glitches, keys, shops...)
+    danger: str  # Area whose danger requirement must be checked when entering it (empty if none)
+    resources: tuple[tuple[str, Any], ...]  # Requirements that involve resources
+    or_resources: tuple[tuple[str, Any], ...]  # Requirements that involve resources, only one of them is needed
+
+    @property
+    def entrance(self) -> str:
+        """Name of the entrance that the rule applies to."""
+        return f"{self.anchor} -> {self.target}"
+
+    @property
+    def tier(self) -> int:
+        """Index of the rule set (0: moki, 1: gorlek, 2: gorlek glitched, ..., 6: unsafe glitched)."""
+        if self.glitches:
+            return self.difficulty + 1
+        return self.difficulty
+
+
+def new_logic() -> dict[str, Any]:
+    """Return an empty parsed logic."""
+    return {
+        "rules": [],  # List of Rule, in the order of the source file
+        "entrances": [],  # Entrance names
+        "refills": {},  # Refill info per region in a tuple: (health, energy, type)
+        "refill_events": [],  # Names given to the refill events
+        "doors_map": {},  # Mapping from door name to door ID
+        "doors_vanilla": [],  # Vanilla connections between the doors
+        "or_chains": Counter(),  # Statistics on the requirements with several `or` chains
+        "placements": {},  # Anchors of each pickup, state and quest
+    }
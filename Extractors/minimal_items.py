@@ -0,0 +1,222 @@
+"""
+Computes the minimal sets of items that unlock each location, for each rule set.
+
+Run `write_minimal_items()` to write `MinimalItems.py` from the parsed `areas.wotw` logic (see `extract_rules.py`),
+for the locations of `loc_data.csv`. The rules are compiled with the reachability engine (see `reachability.py`), with
+the macros inlined. The sets only hold the items of `Items_data.csv`.
+"""
+
+import os
+from collections import deque
+from typing import Any, Iterable
+
+from extract_rules import glitch_items, header, load_logic, tier_levels, tier_names
+from reachability import ReachabilityEngine, read_item_names
+from simplify import glitched_tiers
+
+# Items that can break an energy crystal (`BreakCrystal`) from each difficulty (see the header of `areas.wotw`)
+crystal_weapons = {"Sword": 0, "Hammer": 0, "Bow": 0, "Shuriken": 1, "Grenade": 1, "Spear": 3}
+
+# A link: target, and the alternatives of its clauses as masks of (items, events)
+Link = tuple[str, list[tuple[int, int]]]
+
+
+def bits_of(mask: int) -> list[int]:
+    """Return the masks of the bits set in the mask."""
+    bits = []
+    while mask:
+        bit = mask & -mask
+        bits.append(bit)
+        mask ^= bit
+    return bits
+
+
+def size_key(mask: int) -> tuple[int, int]:
+    """Return the sort key of the set: the number of items first."""
+    return bin(mask).count("1"), mask
+
+
+def add_minimal(sets: list[int], candidates: Iterable[int], max_sets: int = 0) -> list[int]:
+    """
+    Add the candidate sets to the antichain, except those that include one of its sets, and remove the sets that
+    include a new one. With `max_sets`, only the smallest sets are kept (see `size_key`). Return the added sets.
+    """
+    added = []
+    for candidate in sorted(set(candidates), key=size_key):
+        if any(known & candidate == known for known in sets):
+            continue
+        if max_sets and len(sets) >= max_sets:
+            largest = max(sets, key=size_key)
+            if size_key(candidate) >= size_key(largest):
+                continue
+            sets.remove(largest)
+        sets[:] = [known for known in sets if known & candidate != candidate]
+        sets.append(candidate)
+        added.append(candidate)
+    return added
+
+
+def item_extensions(difficulty: int) -> dict[str, list[tuple[str, ...]]]:
+    """Return the alternatives of items that replace the requirements that are not items, for the difficulty."""
+    crystal = [(weapon,) for weapon, weapon_difficulty in crystal_weapons.items() if weapon_difficulty <= difficulty]
+    return dict(glitch_items, BreakCrystal=crystal)
+
+
+def compile_links(
+    engine: ReachabilityEngine, items: Iterable[str], extensions: dict[str, list[tuple[str, ...]]]
+) -> dict[str, list[Link]]:
+    """
+    Return the links of each anchor, with the alternatives of their clauses as masks of (items, events).
+
+    Each clause gives one alternative per skill of its `any_skills` and per option of its costs. The counted items
+    (keystones, gorlek ore) are given a bit, without their amount, and the spirit light, the health and the energy are
+    not included. The requirements of `extensions` are replaced by their alternatives of items, and the alternatives
+    needing another name that is neither one of the `items` nor an event are dropped.
+    """
+    events = 0
+    for bit in engine.events.values():
+        events |= bit
+    items = set(items)
+    options = {
+        engine.allocate((name,)): [engine.allocate(option) for option in alternatives]
+        for name, alternatives in extensions.items()
+        if name in engine.bits
+    }
+    extended = sum(options)
+    unknown = sum(1 << index for name, index in engine.bits.items() if name not in items and name not in extensions)
+    unknown &= ~events
+    links: dict[str, list[Link]] = {}
+    for anchor, exits in engine.exits.items():
+        for target, _, clauses in exits:
+            alternatives: list[int] = []
+            for required, any_of, needed, costs in clauses:
+                required |= engine.allocate(name for name, _ in needed if name in items)
+                for choice in bits_of(any_of) or [0]:
+                    for mask in (required | choice | mask for mask, _, _ in costs or [(0, 0, 0)]):
+                        masks = [mask & ~extended]
+                        for bit in bits_of(mask & extended):
+                            masks = [known | option for known in masks for option in options[bit]]
+                        add_minimal(alternatives, (mask for mask in masks if not mask & unknown))
+            links.setdefault(anchor, []).append((target, [(mask & ~events, mask & events) for mask in alternatives]))
+    return links
+
+
+def combine(combos: list[int], sets: Iterable[int], max_size: int) -> list[int]:
+    """Return the unions of a combination and a set, without those of more than `max_size` items."""
+    return [union for combo in combos for known in sets if bin(union := combo | known).count("1") <= max_size]
+
+
+def minimal_sets(
+    engine: ReachabilityEngine,
+    spawn: str,
+    items: Iterable[str],
+    extensions: dict[str, list[tuple[str, ...]]],
+    max_size: int,
+    max_sets: int,
+) -> dict[str, list[int]]:
+    """
+    Return the minimal sets of items (as masks, see `ReachabilityEngine.bits`) that reach each target from the spawn.
+    The sets only hold the `items`, the other requirements are replaced as in `compile_links`.
+
+    The sets are memoized per anchor, and propagated along the links until a fixpoint. Only the new sets are
+    propagated: the new sets of the anchor with all the sets of the events needed, and all the sets of the anchor with
+    the new sets of an event. The events needed by a clause are replaced by the sets that reach them. The sets of
+    more than `max_size` items are dropped, and only the `max_sets` smallest sets of each anchor are kept.
+    """
+    links = compile_links(engine, items, extensions)
+    event_targets = {bit: target for target, bit in engine.events.items()}
+    users: dict[str, dict[str, None]] = {}  # Anchors with a link that needs the event (ordered, see below)
+    for anchor, anchor_links in links.items():
+        for _, alternatives in anchor_links:
+            for _, events in alternatives:
+                for bit in bits_of(events):
+                    users.setdefault(event_targets[bit], {})[anchor] = None
+
+    # When `max_sets` is reached, the kept sets depend on the order of the propagation: it must not depend on hashes
+    sets: dict[str, list[int]] = {anchor: [0] for anchor in sorted(engine.roots | {spawn})}
+    new_sets: dict[str, list[int]] = {anchor: [0] for anchor in sets}  # Sets of the anchor not propagated yet
+    new_events: dict[str, dict[int, list[int]]] = {}  # New sets of the events, not propagated yet by the anchor
+    queue = deque(sets)
+    while queue:
+        anchor = queue.popleft()
+        fresh = new_sets.pop(anchor, [])
+        fresh_events = new_events.pop(anchor, {})
+        reaching = sets.get(anchor, [])
+        for target, alternatives in links.get(anchor, ()):
+            candidates = []
+            for item_mask, events in alternatives:
+                needed = bits_of(events)
+                sources = [(fresh, None)] + [(reaching, bit) for bit in needed if bit in fresh_events]
+                for known, new_bit in sources:
+                    combos = combine([item_mask], known, max_size)
+                    for bit in needed:
+                        event_sets = fresh_events[bit] if bit == new_bit else sets.get(event_targets[bit], ())
+                        combos = combine(combos, event_sets, max_size)
+                    candidates += combos
+            added = add_minimal(sets.setdefault(target, []), candidates, max_sets)
+            if not added:
+                continue
+            if target not in new_sets and target not in new_events:
+                queue.append(target)
+            new_sets.setdefault(target, []).extend(added)
+            if target in engine.events:
+                for user in users.get(target, ()):
+                    if user not in new_sets and user not in new_events:
+                        queue.append(user)
+                    new_events.setdefault(user, {}).setdefault(engine.events[target], []).extend(added)
+    return sets
+
+
+def write_minimal_items(
+    logic: dict[str, Any], out_dir: str = ".", spawn: str = "MarshSpawn.Main", max_size: int = 6, max_sets: int = 32
+) -> None:
+    """
+    Write `MinimalItems.py` from the parsed logic (with the macros inlined), in the `out_dir` folder: the minimal sets
+    of items unlocking each location of `loc_data.csv` from the spawn, for each rule set (see `minimal_sets` for the
+    bounds). Raise a ValueError if a set holds a name that is not an item of `Items_data.csv`.
+    """
+    with open("./loc_data.csv", "r") as file:
+        locations = [line.split(", ")[0] for line in file.readlines()[1:]]
+    items = read_item_names()
+
+    tier_sets: list[list[list[set[str]]]] = []  # Sets of item names of each location, for each rule set
+    for tier in range(len(tier_names)):
+        engine = ReachabilityEngine(logic, tier_levels[tier], tier in glitched_tiers)
+        extensions = item_extensions(tier_levels[tier])
+        sets = minimal_sets(engine, spawn, items, extensions, max_size, max_sets)
+        names = {1 << index: name for name, index in engine.bits.items()}
+        tier_sets.append(
+            [[{names[bit] for bit in bits_of(mask)} for mask in sets.get(location, ())] for location in locations]
+        )
+    item_names = sorted(set().union(*(item_set for sets in tier_sets for location in sets for item_set in location)))
+    not_items = set(item_names).difference(items)
+    if not_items:
+        raise ValueError(f"The minimal sets hold requirements that are not items: {sorted(not_items)}")
+    item_bits = {name: 1 << index for index, name in enumerate(item_names)}
+
+    with open(os.path.join(out_dir, "MinimalItems.py"), "w") as w_file:
+        w_file.write(header.replace("`extract_rules.py`", "`minimal_items.py`"))
+        w_file.write("item_names: tuple[str, ...] = (\n")
+        for name in item_names:
+            w_file.write(f'    "{name}",\n')
+        w_file.write("    )\n\n")
+        w_file.write(
+            f"# Minimal sets of items unlocking each location from {spawn}, for each rule set in the order of the\n"
+            "# `set_*_rules` functions. Each set is a mask of the indices in `item_names`. The amounts (keystones,\n"
+            "# gorlek ore) are not included, nor the spirit light, health and energy. Only the sets of at most\n"
+            f"# {max_size} items are listed, and only the {max_sets} smallest sets of each anchor are kept: an empty\n"
+            "# tuple means that the location needs more items, or cannot be reached.\n"
+            "minimal_items: dict[str, tuple[tuple[int, ...], ...]] = {\n"
+        )
+        for index, location in enumerate(locations):
+            w_file.write(f'    "{location}": (\n')
+            for sets in tier_sets:
+                masks = sorted(sum(item_bits[name] for name in item_set) for item_set in sets[index])
+                w_file.write(f"        {tuple(masks)},\n")
+            w_file.write("        ),\n")
+        w_file.write("    }\n")
+    print("The file `MinimalItems.py` has been successfully created.")
+
+
+if __name__ == "__main__":
+    write_minimal_items(load_logic(inline_macros=True))
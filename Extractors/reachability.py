@@ -0,0 +1,231 @@
+"""
+Standalone reachability over the parsed logic, with the items and events as the bits of integer masks.
+
+Build a `ReachabilityEngine` from the parsed `areas.wotw` logic with the macros inlined (see
+`extract_rules.load_logic`) for a difficulty, then call `reach()` with a spawn and an inventory to get the reachable
+anchors and locations, without Archipelago.
+Run this module to print an audit of the reachable anchors and locations from the spawn, for each difficulty.
+"""
+
+from typing import Any, Iterable, NamedTuple, Optional
+
+from extract_rules import clause_costs, convert_diff, load_logic, other_glitches, resource_costs, trick_mask
+from logic import Rule
+from simplify import glitched_tiers, simplify_rules
+
+# Item counted by the checks of `other` that have an amount, the danger checks count the maximum health
+counted_items = {"Keystone": "Keystone", "SpiritLight": "Spirit Light", "Ore": "Gorlek Ore", "Danger": "Health"}
+
+impossible = "Impossible"  # Requirement of the states that only the headers can set (e.g. `SkipKwolok`)
+
+base_health = 30  # Maximum health and energy of a new save
+base_energy = 3
+
+# A compiled clause: mask of the bits all needed, mask of the bits of which one is needed (0 if none), counted items
+# needed (name, amount), and the options to pay the resources (mask of the skills, energy in quarters, damage), or
+# None if the clause has no resource
+Clause = tuple[int, int, tuple[tuple[str, int], ...], Optional[tuple[tuple[int, int, int], ...]]]
+
+
+class Reachable(NamedTuple):
+    """Result of a reachability query."""
+
+    anchors: set[str]  # Reachable regions
+    locations: set[str]  # Reachable pickups, states and quests
+    events: set[str]  # Events obtained on the way (states, quests, danger events...)
+
+
+def free_resources(rule: Rule) -> Rule:
+    """Return the clause without the walls and the combat, whose costs depend on data that the logic does not have."""
+    resources = tuple(resource for resource in rule.resources if resource_costs(resource) is not None)
+    or_resources = rule.or_resources
+    if any(resource_costs(resource) is None for resource in or_resources):
+        or_resources = ()  # One of the alternatives is free
+    return rule._replace(resources=resources, or_resources=or_resources)
+
+
+class ReachabilityEngine:
+    """
+    Compute the regions and locations reachable with an inventory, over integer masks.
+
+    The logic must be parsed with `inline_macros` (see `extract_rules.load_logic`), else the macros are used as items.
+    The rules of the difficulty (0: moki, 1: gorlek, 2: kii, 3: unsafe, with the glitches if `glitches`, and only the
+    tricks of the `tricks` mask, see `extract_rules.trick_bits`) are compiled once into clauses (see `Clause`): the
+    items, events and glitches are bit positions, and the resources are precomputed costs (see `clause_costs`). The
+    glitches of `other_glitches` are bits too, they are owned if given with the items. The clauses that need
+    `Impossible` are dropped, and the targets of any difficulty are events (they cannot be owned as items).
+    The walls and the combat depend on weapon and enemy data that the logic does not have: with `assume_combat` they
+    are considered passable, else the clauses using them are dropped. The costs are compared with the maximum energy
+    and health, without the refills, the shards and the moki modifiers. The keystone doors check the keystones only.
+    """
+
+    def __init__(
+        self,
+        logic: dict[str, Any],
+        difficulty: int = 0,
+        glitches: bool = False,
+        tricks: int = -1,
+        assume_combat: bool = True,
+    ) -> None:
+        level = list(convert_diff.values())[difficulty]
+        rules = [
+            rule
+            for rule in logic["rules"]
+            if rule.difficulty <= level
+            and (glitches or rule.tier not in glitched_tiers)
+            and tricks & trick_mask(rule) == trick_mask(rule)
+        ]
+        self.bits: dict[str, int] = {}  # Bit of each item, event and glitch
+        self.exits: dict[str, list[tuple[str, int, list[Clause]]]] = {}  # Target, its bit and its clauses, per anchor
+        self.placements = set(logic["placements"])
+        entrances: dict[str, list[Clause]] = {}
+        for rule in simplify_rules(rules):
+            clause = self.compile(rule if clause_costs(rule) is not None or not assume_combat else free_resources(rule))
+            if clause is not None:
+                entrances.setdefault(rule.entrance, []).append(clause)
+        for door, other_door in logic["doors_vanilla"]:  # The doors are not randomized
+            entrances[f"{door} -> {other_door}"] = [(0, 0, (), None)]
+        targets = {entrance.split(" -> ")[1] for entrance in entrances}
+        all_targets = targets | {entrance.split(" -> ")[1] for entrance in logic["entrances"]}
+        self.events = {target: 1 << self.bits[target] for target in all_targets if target in self.bits}  # Event bits
+        for entrance, clauses in entrances.items():
+            anchor, target = entrance.split(" -> ")
+            self.exits.setdefault(anchor, []).append((target, self.events.get(target, 0), clauses))
+        self.anchors = {rule.anchor for rule in logic["rules"]} | {door for door, _ in logic["doors_vanilla"]}
+        # The anchors that no entrance leads to (i.e. `Menu`) are always reached, those whose links were all dropped
+        # are never reached
+        self.roots = set(self.exits) - all_targets
+        self.blocked = all_targets - targets  # Targets without a link that can be used
+
+    def allocate(self, names: Iterable[str]) -> int:
+        """Return the mask of these items, events and glitches, giving a bit to the new ones."""
+        mask = 0
+        for name in names:
+            index = self.bits.get(name)
+            if index is None:
+                index = self.bits[name] = len(self.bits)
+            mask |= 1 << index
+        return mask
+
+    def mask(self, names: Iterable[str]) -> int:
+        """Return the mask of these items, events and glitches (the names that no rule uses are ignored)."""
+        mask = 0
+        for name in names:
+            if name in self.bits:
+                mask |= 1 << self.bits[name]
+        return mask
+
+    def compile(self, rule: Rule) -> Optional[Clause]:
+        """
+        Return the compiled clause of the rule, or None if it needs `Impossible` or if its resources cannot be checked
+        (see `assume_combat`).
+        """
+        any_skills = tuple(skill for skill in rule.any_skills if skill != impossible)
+        if impossible in rule.skills or rule.any_skills and not any_skills:
+            return None
+        required = self.allocate(rule.skills + ((f"danger_{rule.danger}",) if rule.danger else ()))
+        any_of = self.allocate(any_skills)
+        amounts: list[tuple[str, int]] = []
+        for elem in rule.other:
+            if "=" in elem:
+                name, amount = elem.split("=")
+                if name != "Keystone" or rule.target != "MidnightBurrows.Teleporter":  # See `render_clause`
+                    amounts.append((counted_items[name], int(amount)))
+            elif elem in other_glitches:
+                required |= self.allocate((elem,))
+            else:
+                raise ValueError(f"Invalid input: {elem}")
+        costs = None
+        if rule.resources or rule.or_resources:
+            options = clause_costs(rule)
+            if options is None:
+                return None
+            costs = tuple((self.allocate(skills), energy, damage) for skills, energy, damage in options)
+        return required, any_of, tuple(amounts), costs
+
+    def reach(
+        self,
+        spawn: str,
+        items: Iterable[str] = (),
+        counts: Optional[dict[str, int]] = None,
+        health: int = base_health,
+        energy: int = base_energy,
+    ) -> Reachable:
+        """
+        Return the anchors, locations and events reachable from the spawn anchor with the inventory.
+
+        `items` holds the owned items and the glitches that can be done, `counts` the number of keystones, spirit light
+        and gorlek ore (see `counted_items`), and `health` and `energy` the maximum health and energy.
+        The reached targets give their bit (e.g. the states and the danger events). The links of the reached anchors
+        are followed at once, and the failed ones are checked again after each round that gave new bits.
+        """
+        owned = self.mask(items)
+        amounts = dict(counts or {}, Health=health)
+        energy *= 4  # The costs are in quarters of energy
+        reached = self.roots | {spawn}
+        pending = [link for anchor in reached for link in self.exits.get(anchor, ())]
+        while True:
+            checked = owned  # Bits owned when the round starts
+            waiting: list[tuple[str, int, list[Clause]]] = []  # Links that failed in this round
+            while pending:
+                target, bit, clauses = link = pending.pop()
+                if target in reached:
+                    continue
+                for required, any_of, needed, costs in clauses:
+                    if required & owned != required or (any_of and not any_of & owned):
+                        continue
+                    if needed and any(amounts.get(name, 0) < amount for name, amount in needed):
+                        continue
+                    if costs is None:
+                        break
+                    if any(mask & owned == mask and cost <= energy and hurt < health for mask, cost, hurt in costs):
+                        break
+                else:
+                    waiting.append(link)
+                    continue
+                reached.add(target)
+                owned |= bit
+                pending += self.exits.get(target, ())
+            if owned == checked:
+                break
+            pending = waiting
+
+        events = {name for name, bit in self.events.items() if owned & bit}
+        return Reachable(reached & self.anchors, reached & self.placements, events)
+
+
+def read_item_names(path: str = "./Items_data.csv") -> list[str]:
+    """Return the names of the items of the `Items_data.csv` file."""
+    with open(path, "r") as file:
+        return [line.split(",")[0] for line in file.readlines()[1:]]
+
+
+def audit(spawn: str = "MarshSpawn.Main") -> None:
+    """
+    Print the number of anchors and locations reachable from the spawn, without and with all the items.
+
+    Check that the targets without a link that can be used are not reached, even with all the items and without
+    assuming the combat (see `ReachabilityEngine`).
+    """
+    logic = load_logic(inline_macros=True)
+    items = read_item_names()
+    counts = {"Keystone": 40, "Spirit Light": 20000, "Gorlek Ore": 40}
+    print(f"Reachable from {spawn} (anchors, locations): no items, all the items")
+    for difficulty, name in enumerate(convert_diff):
+        engine = ReachabilityEngine(logic, difficulty)
+        empty = engine.reach(spawn)
+        full = engine.reach(spawn, items, counts, 200, 20)
+        print(
+            f"    {name:<8}{len(empty.anchors):>6}{len(empty.locations):>6}"
+            f"{len(full.anchors):>10}{len(full.locations):>6}  (of {len(engine.anchors)}, {len(engine.placements)})"
+        )
+
+    engine = ReachabilityEngine(logic, assume_combat=False)
+    full = engine.reach(spawn, items, counts, 200, 20)
+    reached = engine.blocked & (full.anchors | full.locations)
+    assert not reached, f"Targets reached without a link that can be used: {sorted(reached)}"
+    print(f"Targets without a link that can be used (moki, no combat): {len(engine.blocked)}, none reached")
+
+
+if __name__ == "__main__":
+    audit()
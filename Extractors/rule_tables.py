@@ -0,0 +1,55 @@
+"""
+Writes the rules as compact requirement tables, with a generic evaluator, instead of one lambda per rule.
+
+Run `write_tables()` to write `RulesTables.py` from the parsed `areas.wotw` logic (see `extract_rules.py`).
+The generated module provides the same `set_*_rules` functions as `Rules.py`.
+"""
+
+import os
+from typing import Any
+
+from extract_rules import header, imports, load_logic, read_template, requirement_row, rule_headers, tier_names
+from logic import Rule
+from simplify import prune_tiers, simplify_rules
+
+
+def build_tables(rules: list[Rule]) -> tuple[list[str], list[list[tuple]]]:
+    """Return the entrance names, and the rows of the requirement table for each difficulty."""
+    entrance_index: dict[str, int] = {}
+    tables: list[list[tuple]] = [[] for _ in rule_headers]
+    for rule in rules:
+        index = entrance_index.setdefault(rule.entrance, len(entrance_index))
+        tables[rule.tier].append((index,) + requirement_row(rule))
+    return list(entrance_index), tables
+
+
+def write_tables(logic: dict[str, Any], out_dir: str = ".") -> None:
+    """Write `RulesTables.py` from the parsed logic (as returned by `RulesParser.parse`), in the `out_dir` folder."""
+    entrance_names, tables = build_tables(prune_tiers(simplify_rules(logic["rules"])))
+    with open(os.path.join(out_dir, "RulesTables.py"), "w") as w_file:
+        w_file.write(header.replace("`extract_rules.py`", "`rule_tables.py`"))
+        w_file.write("from functools import partial\n\n" + imports)
+        w_file.write("entrance_names: tuple[str, ...] = (\n")
+        for name in entrance_names:
+            w_file.write(f'    "{name}",\n')
+        w_file.write("    )\n\n")
+        w_file.write(
+            "# One table per difficulty, in the order of the `set_*_rules` functions. Each row contains:\n"
+            "# entrance index, skills (all needed), skills (one needed), other checks, danger event, resources,\n"
+            "# or resources, moki.\n"
+            "rule_table: tuple[tuple[tuple, ...], ...] = (\n"
+        )
+        for name, table in zip(tier_names, tables):
+            w_file.write(f"    (  # {name}\n")
+            for row in table:
+                w_file.write(f"        {row},\n")
+            w_file.write("    ),\n")
+        w_file.write("    )\n")
+        w_file.write("\n\n" + read_template("tables"))  # Evaluator of the tables
+        for tier, name in enumerate(tier_names):
+            w_file.write(f'\n\ndef set_{name}_rules(w: "WotWWorld"):\n    set_table_rules(w, {tier})\n')
+    print("The file `RulesTables.py` has been successfully created.")
+
+
+if __name__ == "__main__":
+    write_tables(load_logic())
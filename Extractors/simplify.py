@@ -0,0 +1,158 @@
+"""
+Simplification of the requirement clauses, before the rules are written.
+
+The clauses of an entrance in the same difficulty are combined with `or`, so a clause that is at least as strict as
+another clause of the group can never change the result: it is removed. This covers the duplicate clauses, the clauses
+absorbed by a weaker one (`A and B` next to `A`), and the whole group when one of its clauses is always true.
+The harder rule sets are added on top of the easier ones in the same way, so the clauses already covered by an easier
+rule set are also removed (see `prune_tiers`).
+When the glitched rules are registered per trick (`tricks`), a clause can only be removed by a clause that uses a
+part of its glitches, as the other glitches may be disabled.
+"""
+
+from collections import Counter
+from typing import Iterable, Optional
+
+from logic import Rule
+
+
+def clean_clause(rule: Rule) -> Rule:
+    """Return the clause without its duplicate checks."""
+    skills = tuple(dict.fromkeys(rule.skills))
+    any_skills = tuple(dict.fromkeys(rule.any_skills))
+    if any_skills and not set(any_skills).isdisjoint(skills):  # One of these skills is needed anyway
+        any_skills = ()
+    elif len(any_skills) == 1:  # A single choice is a normal requirement, checked with the other skills
+        skills += any_skills
+        any_skills = ()
+    other = tuple(dict.fromkeys(rule.other))
+    if (skills, any_skills, other) == (rule.skills, rule.any_skills, rule.other):
+        return rule
+    return rule._replace(skills=skills, any_skills=any_skills, other=other)
+
+
+def is_always_true(rule: Rule) -> bool:
+    """Return True if the clause has no requirement."""
+    return not (rule.skills or rule.any_skills or rule.other or rule.danger or rule.resources or rule.or_resources)
+
+
+def implies(rule: Rule, weaker: Rule, tricks: bool = False) -> bool:
+    """
+    Return True if the clause `weaker` is true whenever `rule` is true (both clauses being for the same entrance and
+    difficulty).
+
+    The resource costs only grow with the resources to pay, so the resources of `weaker` must be a part of those of
+    `rule`, with the same alternative resources if `weaker` has some. With `tricks`, the glitches of `weaker` must also
+    be a part of those of `rule`.
+    """
+    if tricks and not set(weaker.glitches).issubset(rule.glitches):
+        return False
+    if not set(weaker.skills).issubset(rule.skills) or not set(weaker.other).issubset(rule.other):
+        return False
+    if weaker.any_skills and set(weaker.any_skills).isdisjoint(rule.skills):
+        if not rule.any_skills or not set(rule.any_skills).issubset(weaker.any_skills):
+            return False
+    if weaker.danger and weaker.danger != rule.danger:
+        return False
+    if weaker.or_resources and Counter(weaker.or_resources) != Counter(rule.or_resources):
+        return False
+    if weaker.resources and Counter(weaker.resources) - Counter(rule.resources):  # Some resources are not in `rule`
+        return False
+    return True
+
+
+def simplify_group(clauses: list[Rule], stats: Counter, tricks: bool = False) -> list[bool]:
+    """Return which clauses of the group (same entrance and difficulty) are kept, and count the removed ones."""
+    kept = [True] * len(clauses)
+    for i, clause in enumerate(clauses):
+        for j, other in enumerate(clauses):
+            if i == j or not kept[j] or not implies(clause, other, tricks):
+                continue
+            if implies(other, clause, tricks):  # Same requirements: the first clause is kept
+                if j > i:
+                    continue
+                stats["duplicate"] += 1
+            elif is_always_true(other):
+                stats["always true"] += 1
+            else:
+                stats["absorbed"] += 1
+            kept[i] = False
+            break
+    return kept
+
+
+def simplify_rules(rules: Iterable[Rule], stats: Optional[Counter] = None, tricks: bool = False) -> list[Rule]:
+    """
+    Return the rules without the duplicate checks and the redundant clauses, in the same order.
+
+    The number of removed clauses is added to `stats` for each reason (duplicate, always true, absorbed), as well as
+    the number of clauses that had duplicate checks (cleaned). See `implies` for `tricks`.
+    """
+    if stats is None:
+        stats = Counter()
+    clauses: list[Rule] = []
+    groups: dict[tuple[str, int], list[int]] = {}  # Indices of the clauses of each entrance and difficulty
+    for rule in rules:
+        clause = clean_clause(rule)
+        if clause is not rule:
+            stats["cleaned"] += 1
+        groups.setdefault((clause.entrance, clause.tier), []).append(len(clauses))
+        clauses.append(clause)
+
+    kept = [True] * len(clauses)
+    for indices in groups.values():
+        if len(indices) > 1:
+            for index, keep in zip(indices, simplify_group([clauses[index] for index in indices], stats, tricks)):
+                kept[index] = keep
+    return [clause for clause, keep in zip(clauses, kept) if keep]
+
+
+# %% Cross-difficulty pruning
+
+glitched_tiers = {2, 4, 6}  # Rule sets with glitches (see `Rule.tier`)
+
+
+def tier_included(lower: int, tier: int) -> bool:
+    """
+    Return True if the rule set `lower` is always set when the rule set `tier` is.
+
+    The harder rule sets are added on top of the easier ones, and the glitched rule sets only with the glitches.
+    """
+    return lower < tier and (lower not in glitched_tiers or tier in glitched_tiers)
+
+
+def subsumes(lower: Rule, rule: Rule, tricks: bool = False) -> bool:
+    """Return True if the clause `lower` (from an included rule set) is true whenever `rule` is true."""
+    if (lower.resources or lower.or_resources) and (lower.difficulty == 0) != (rule.difficulty == 0):
+        return False  # The resources are checked with the moki flag, the results cannot be compared
+    return implies(rule, lower, tricks)
+
+
+def prune_tiers(rules: Iterable[Rule], stats: Optional[list[Counter]] = None, tricks: bool = False) -> list[Rule]:
+    """
+    Return the rules without the clauses that a clause of an included rule set already covers, in the same order.
+
+    For each rule set, `stats` counts the removed clauses ("clauses"), and the removed resource checks ("resources").
+    See `implies` for `tricks`.
+    """
+    if stats is None:
+        stats = [Counter() for _ in range(7)]
+    rules = list(rules)
+    groups: dict[str, list[int]] = {}  # Indices of the clauses of each entrance
+    for index, rule in enumerate(rules):
+        groups.setdefault(rule.entrance, []).append(index)
+
+    kept = [True] * len(rules)
+    for indices in groups.values():
+        if len(indices) == 1:
+            continue
+        for i in indices:
+            rule = rules[i]
+            for j in indices:
+                if tier_included(rules[j].tier, rule.tier) and subsumes(rules[j], rule, tricks):
+                    kept[i] = False
+                    stats[rule.tier]["clauses"] += 1
+                    if rule.resources or rule.or_resources:
+                        stats[rule.tier]["resources"] += 1
+                    break
+    return [rule for rule, keep in zip(rules, kept) if keep]
@@ -0,0 +1,25 @@
+"""
+Function of the dispatcher adding the rules needed by the options, copied after the `set_*_rules` functions in the
+generated `Rules.py` (see `extract_rules.write_split`). This file is not imported.
+"""
+
+
+def set_difficulty_rules(w: "WotWWorld", difficulty: int, glitches: bool, *args):
+    """
+    Add the rules of the difficulty (0: moki, 1: gorlek, 2: kii, 3: unsafe) and of the easier ones, with the
+    glitched rules if `glitches` is set (the other arguments are given to the glitched rule functions).
+    Only the modules of these rules are imported.
+    """
+    set_moki_rules(w)
+    if difficulty >= 1:
+        set_gorlek_rules(w)
+        if glitches:
+            set_gorlek_glitched_rules(w, *args)
+    if difficulty >= 2:
+        set_kii_rules(w)
+        if glitches:
+            set_kii_glitched_rules(w, *args)
+    if difficulty >= 3:
+        set_unsafe_rules(w)
+        if glitches:
+            set_unsafe_glitched_rules(w, *args)
@@ -0,0 +1,74 @@
+"""
+Functions binding the rule factories to the worlds, copied after `tier_rules` in the generated `Rules.py` (see
+`extract_rules.RuleFactories`). This file is not imported: the names it uses are those of the generated module.
+"""
+
+_built: dict[tuple, tuple[tuple[str, Callable], ...]] = {}  # Combined rules for each set of options
+
+
+def any_rule(rules: tuple[Callable, ...]) -> Callable:
+    """Return a rule function that is true if one of the rule functions is."""
+    def rule(p: int, o, s) -> bool:
+        for part in rules:
+            if part(p, o, s):
+                return True
+        return False
+    return rule
+
+
+def get_spot(w: "WotWWorld", name: str):
+    """Return the entrance that the rule applies to, or the location for the names without ` -> `."""
+    return w.get_entrance(name) if " -> " in name else w.get_location(name)
+
+
+def build_rules(
+    difficulty: int, glitches: bool, tricks: int = -1, spawn: int = 0, keystone_doors: bool = True
+) -> tuple[tuple[str, Callable], ...]:
+    """
+    Return the entrances (or locations) and their rule function for these options (see `set_difficulty_rules`).
+
+    The rule functions are combined once for each set of options, and shared by all the worlds using it.
+    """
+    key = (difficulty, glitches, tricks, spawn, keystone_doors)
+    if key not in _built:
+        entrance_rules: dict[str, list[Callable]] = {}
+        for tier, rows in enumerate(tier_rules):
+            if tier_levels[tier] <= difficulty and (glitches or tier not in glitched_tiers):
+                for entrance, mask, rule, specialized in rows:
+                    if tricks & mask == mask:
+                        if specialized:
+                            rule = rule(spawn, keystone_doors)
+                        entrance_rules.setdefault(entrance, []).append(rule)
+        _built[key] = tuple(
+            (entrance, rules[0] if len(rules) == 1 else any_rule(tuple(rules)))
+            for entrance, rules in entrance_rules.items()
+        )
+    return _built[key]
+
+
+def set_difficulty_rules(
+    w: "WotWWorld", difficulty: int, glitches: bool, tricks: int = -1, keystone_doors: bool = True
+):
+    """
+    Add the rules of the difficulty (0: moki, 1: gorlek, 2: kii, 3: unsafe) and of the easier ones, with the
+    glitched rules if `glitches` is set (only those of the enabled tricks). Each entrance gets a single rule.
+    Without `keystone_doors`, the specialized rules do not check the keystone doors.
+    """
+    p = w.player
+    o = w.options
+    reset_locations(w)
+    for entrance, rule in build_rules(difficulty, glitches, tricks, o.spawn.value, keystone_doors):
+        add_rule(get_spot(w, entrance), partial(rule, p, o), "or")
+
+
+def add_tier_rules(w: "WotWWorld", tier: int, tricks: int = -1, keystone_doors: bool = True):
+    """Add the rules of the rule set (only those of the enabled tricks, see `set_difficulty_rules`)."""
+    p = w.player
+    o = w.options
+    if tier == 0:
+        reset_locations(w)
+    for entrance, mask, rule, specialized in tier_rules[tier]:
+        if tricks & mask == mask:
+            if specialized:
+                rule = rule(o.spawn.value, keystone_doors)
+            add_rule(get_spot(w, entrance), partial(rule, p, o), "or")
@@ -0,0 +1,60 @@
+"""
+Generic evaluator of the requirement tables, copied after the tables in the generated `RulesTables.py` (see
+`rule_tables.write_tables`). This file is not imported: the names it uses are those of the generated module.
+"""
+
+# Codes of the checks that have their own function
+DOOR, SHOP, MAP, ORE, DANGER, GLITCH = range(6)
+
+
+def evaluate(row: tuple, anchor: str, p: int, o, s) -> bool:
+    """Return True if the state fulfills the requirements of the row."""
+    _, skills, any_skills, others, danger, resources, or_resources, moki = row
+    if skills and not s.has_all(skills, p):
+        return False
+    for code, arg in others:
+        if code == DOOR:
+            ok = can_open_door(arg, s, p, o.spawn.value)
+        elif code == SHOP:
+            ok = can_buy_shop(s, p)
+        elif code == MAP:
+            ok = can_buy_map(s, p)
+        elif code == ORE:
+            ok = s.count("Gorlek Ore", p) >= arg
+        elif code == DANGER:
+            ok = has_enough_max_health(s, p, o, arg)
+        else:
+            ok = globals()[arg](s, p)
+        if not ok:
+            return False
+    if any_skills and not s.has_any(any_skills, p):
+        return False
+    if danger and not s.has(danger, p):
+        return False
+    if resources or or_resources:
+        return has_enough_resources(resources, or_resources, anchor, s, p, o, moki)
+    return True
+
+
+def evaluate_any(rows: tuple, anchor: str, p: int, o, s) -> bool:
+    """Return True if the state fulfills the requirements of one of the rows."""
+    for row in rows:
+        if evaluate(row, anchor, p, o, s):
+            return True
+    return False
+
+
+def set_table_rules(w: "WotWWorld", tier: int) -> None:
+    """Add the rules of the table for this difficulty (see `rule_table`), with one access rule per entrance."""
+    p = w.player
+    o = w.options
+    entrance_rows: dict[int, list[tuple]] = {}
+    for row in rule_table[tier]:
+        entrance_rows.setdefault(row[0], []).append(row)
+    for index, rows in entrance_rows.items():
+        entrance = entrance_names[index]
+        anchor = entrance[: entrance.index(" -> ")]
+        if len(rows) == 1:
+            add_rule(w.get_entrance(entrance), partial(evaluate, rows[0], anchor, p, o), "or")
+        else:
+            add_rule(w.get_entrance(entrance), partial(evaluate_any, tuple(rows), anchor, p, o), "or")
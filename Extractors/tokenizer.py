@@ -0,0 +1,162 @@
+"""
+Tokenizes the `areas.wotw` file into a stream of line records shared by all the extractors.
+
+Each record holds the line number, the number of indents and the text without the indents, comments and trailing
+spaces. Empty lines (after removing the comments) are skipped. The text of a record can then be split into its
+fields with `lex`.
+See https://github.com/ori-community/wotw-seedgen/tree/main/wotw_seedgen to get this file.
+"""
+
+import os
+import re
+from typing import Iterable, NamedTuple
+
+
+class Line(NamedTuple):
+    """A non-empty line of `areas.wotw`."""
+
+    number: int  # Line number in the file (starts at 1)
+    indent: int  # Number of indents
+    text: str  # Content of the line, without the indents, the comments and the trailing spaces
+
+
+# Tokenized files, with the modification time and size of the file when it was read
+_read_cache: dict[str, tuple[tuple[int, int], tuple[Line, ...]]] = {}
+
+
+_new = tuple.__new__  # Faster than the NamedTuple constructors, used in the loops over all the lines
+
+
+def tokenize(source: Iterable[str]) -> tuple[Line, ...]:
+    """Convert the lines of text into line records."""
+    records: list[Line] = []
+    append = records.append
+    for number, text in enumerate(source, 1):
+        if "#" in text:  # Remove the comments
+            text = text[: text.index("#")]
+        text = text.rstrip(" \n")  # Remove the trailing spaces
+        if not text:
+            continue
+        stripped = text.lstrip(" ")  # Count the indents
+        append(_new(Line, (number, (len(text) - len(stripped) + 1) // 2, stripped)))
+    return tuple(records)
+
+
+def read_areas(path: str = "./areas.wotw") -> tuple[Line, ...]:
+    """
+    Return the tokenized `areas.wotw` file.
+
+    The result is kept in memory, so the file is only read and tokenized once per run, unless it is modified.
+    """
+    stat = os.stat(path)
+    key = os.path.abspath(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    cached = _read_cache.get(key)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    with open(path, "r") as file:
+        records = tokenize(file)
+    _read_cache[key] = (stamp, records)
+    return records
+
+
+# %% Lexer
+
+
+class Token(NamedTuple):
+    """Content of a line of `areas.wotw`, as returned by `lex`."""
+
+    kind: str  # Kind of line: a keyword (anchor, conn, moki...), "difficulty", or "line" for a requirement line
+    name: str  # Name of the anchor, region, macro, path, refill type or difficulty (empty otherwise)
+    value: str  # Rest of the line (requirements, door ID, door target...) without the final colon
+    block: bool  # True if the line ends with a colon, i.e. its content continues on the next lines
+
+
+def _lex_header(keyword: str, text: str, start: int) -> Token:
+    """Lex a line starting a top level block (`anchor`, `region` or `requirement`)."""
+    rest = text[start:]
+    colon = rest.rfind(":")
+    if colon == -1:
+        name, value = rest, ""
+    else:
+        name, value = rest[:colon], rest[colon + 1 :].lstrip(" ")
+    if keyword == "anchor":
+        at = name.find(" at ")  # Remove the ` at <coord>` part if it exists
+        if at != -1:
+            name = name[:at]
+    return _new(Token, (keyword, name, value, text[-1] == ":"))
+
+
+def _lex_path(keyword: str, text: str, start: int) -> Token:
+    """Lex a path (`conn`, `state`, `pickup`, `quest` or `refill`), its name is before the first colon."""
+    colon = text.find(":", start)
+    if colon == -1:  # Case of a refill without colon (i.e. `refill Full`)
+        return _new(Token, (keyword, text[start:], "", False))
+    if text[-1] == ":":
+        return _new(Token, (keyword, text[start:colon], text[colon + 1 : -1].lstrip(" "), True))
+    return _new(Token, (keyword, text[start:colon], text[colon + 1 :].lstrip(" "), False))
+
+
+def _lex_difficulty(keyword: str, text: str, start: int) -> Token:
+    """Lex a line starting with a difficulty (`moki: ...` or `gorlek, ...:`)."""
+    if text[start - 1 : start] not in (":", ","):  # A difficulty is always followed by a comma or a colon
+        return _lex_line(text)
+    if text[-1] == ":":
+        return _new(Token, ("difficulty", keyword, text[start:-1].lstrip(" "), True))
+    return _new(Token, ("difficulty", keyword, text[start:].lstrip(" "), False))
+
+
+def _lex_field(keyword: str, text: str, start: int) -> Token:
+    """Lex a door field or an anchor property (`door:`, `id: 5`, `target: X`, `enter:`, `nospawn`...)."""
+    if text[-1] == ":":
+        return _new(Token, (keyword, "", text[start:-1].lstrip(" "), True))
+    return _new(Token, (keyword, "", text[start:].lstrip(" "), False))
+
+
+def _lex_line(text: str) -> Token:
+    """Lex a requirement line."""
+    if text[-1] == ":":
+        return _new(Token, ("line", "", text[:-1], True))
+    return _new(Token, ("line", "", text, False))
+
+
+# Function that lexes the line, for each keyword that can start a line
+_dispatch = {
+    "anchor": _lex_header,
+    "region": _lex_header,
+    "requirement": _lex_header,
+    "conn": _lex_path,
+    "state": _lex_path,
+    "pickup": _lex_path,
+    "quest": _lex_path,
+    "refill": _lex_path,
+    "moki": _lex_difficulty,
+    "gorlek": _lex_difficulty,
+    "kii": _lex_difficulty,
+    "unsafe": _lex_difficulty,
+    "door": _lex_field,
+    "id": _lex_field,
+    "target": _lex_field,
+    "enter": _lex_field,
+    "nospawn": _lex_field,
+    "tprestriction": _lex_field,
+}
+
+_keyword = re.compile("[a-z]+").match  # Lower case word at the start of the line
+
+
+def lex(text: str) -> Token:
+    """
+    Return the token for the text of a line (as given in the line records).
+
+    The keyword at the start of the line selects the function that reads the rest of the line, so each line is only
+    scanned once. Lines that do not start with a known keyword are requirement lines (kind "line").
+    """
+    if not text[0].islower():  # Requirements start with an upper case letter
+        return _lex_line(text)
+    end = _keyword(text).end()
+    handler = _dispatch.get(text[:end])
+    if handler is None:  # Case of `free`, or of an unknown keyword
+        return _lex_line(text)
+    return handler(text[:end], text, end + 1)